@@ -0,0 +1,51 @@
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+
+ONES = ['Zero', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten', 'Eleven', 'Twelve',
+        'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen', 'Eighteen', 'Nineteen']
+TENS = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
+
+# Words for 0-99, every group below a crore is spelt from this table
+BELOW_HUNDRED = tuple(ONES[number] if number < 20
+                      else TENS[number // 10] + (f' {ONES[number % 10]}' if number % 10 else '')
+                      for number in range(100))
+
+# Indian grouping, 1,23,45,678 is 1 crore 23 lakh 45 thousand 6 hundred and 78; no group below a crore exceeds 99
+INDIAN_GROUPS = ((10 ** 5, 'Lakh'), (1000, 'Thousand'), (100, 'Hundred'))
+CRORE = 10 ** 7
+
+
+def integer_words(number):
+    """A whole number >= 0 in words with Lakh and Crore, amounts above 99 crore count crores"""
+    if number == 0:
+        return ONES[0]
+    words = []
+    crores, number = divmod(number, CRORE)
+    if crores:
+        words += [integer_words(crores), 'Crore']
+    count = 0
+    for divisor, name in INDIAN_GROUPS:
+        count, number = divmod(number, divisor)
+        if count:
+            words += [BELOW_HUNDRED[count], name]
+    if number:
+        if count:  # Hundreds, the last group: 'Two Hundred and Six' but 'One Thousand Six'
+            words.append('and')
+        words.append(BELOW_HUNDRED[number])
+    return ' '.join(words)
+
+
+@lru_cache(maxsize=4096)
+def amount_in_words(amount):
+    """Rupees and paise in words, 1261.05 -> 'Rupees One Thousand Two Hundred and Sixty One and Five Paise Only'.
+
+    The amount is rounded half up to whole paise. Totals repeat a lot, on screen while
+    a bill is edited and across a batch of invoices, so results are cached.
+    """
+    paise = int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    sign = 'Minus ' if paise < 0 else ''
+    rupees, paise = divmod(abs(paise), 100)
+    words = f'{sign}Rupees {integer_words(rupees)}'
+    if paise:
+        words += f' and {BELOW_HUNDRED[paise]} Paise'
+    return words + ' Only'
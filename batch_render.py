@@ -0,0 +1,162 @@
+"""Re-generates invoice PDFs for saved bills without opening the billing window.
+
+    python batch_render.py --financial-year 24-25
+    python batch_render.py --client "Client A" --date-from 2024-04-01 --date-to 2024-06-30 --processes 8
+    python batch_render.py --bill MV/24-25/17 --bill MV/24-25/18 --output "Invoices/Reprint"
+    python batch_render.py --financial-year 24-25 --engine reportlab
+
+Bills are read from the invoice database and rendered with the current
+Input/invoice_template.html and company details, across a pool of processes.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+from invoice_render import (INVOICE_ENGINES, build_invoice_context, configured_invoice_engine, invoice_file_name,
+                            render_invoice, template_environment)
+from invoice_journal import parse_bill_no
+from invoice_storage import open_invoice_store
+from master_data import ConfigService, MasterDataSnapshot
+from render_cache import RenderCache
+
+INPUT_FILES_PATH = 'Input'
+INVOICE_PATH = 'Invoices'
+DATABASE_PATH = 'Database'
+DETAILS_PATH = 'Bill Details'
+DATABASE_FILE = 'Invoice_Datas.json'
+
+render_settings = {}
+
+
+def init_render_worker(engine, template_path, wkhtmltopdf, use_cache):
+    render_settings['engine'] = engine
+    render_settings['render_cache'] = RenderCache(os.path.join(DATABASE_PATH, 'Render_Cache')) if use_cache else None
+    render_settings['template_path'] = template_path
+    render_settings['wkhtmltopdf'] = wkhtmltopdf
+    if engine != 'reportlab':
+        # Each worker compiles once, from the bytecode cache the parent filled
+        template_environment().get_template(template_path)
+
+
+def render_job(job):
+    bill_no, context, output_path = job
+    started = time.perf_counter()
+    cached = False
+    try:
+        cached = render_invoice(context, output_path, render_settings['engine'], render_settings['template_path'],
+                                render_settings['wkhtmltopdf'], render_settings['render_cache'])
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return bill_no, error, cached, time.perf_counter() - started
+
+
+def select_entries(invoice_store, args):
+    if args.bill:
+        for bill_no in args.bill:
+            entry = invoice_store.get_invoice(bill_no)
+            if entry is None:
+                print(f'{bill_no}: not found, skipped')
+            else:
+                yield entry
+        return
+    yield from invoice_store.find_invoices(financial_years=args.financial_year, client_name=args.client,
+                                           date_from=args.date_from, date_to=args.date_to)
+
+
+def legacy_client_names(details_path=DETAILS_PATH):
+    """bill_no -> client name, from the per bill workbooks ('MV_23-24_1_<client>.xlsx') older versions wrote"""
+    client_names = {}
+    if not os.path.isdir(details_path):
+        return client_names
+    for file_name in os.listdir(details_path):
+        stem, extension = os.path.splitext(file_name)
+        parts = stem.split('_', 3)
+        if extension.lower() == '.xlsx' and len(parts) == 4 and parse_bill_no('/'.join(parts[:3]))[1] is not None:
+            client_names['/'.join(parts[:3])] = parts[3]
+    return client_names
+
+
+def build_jobs(entries, config_service, output_path, details_path=DETAILS_PATH):
+    """Bills migrated from the old json file carry no client name; it is taken from their Bill Details
+    workbook when there is one, otherwise the invoice is rendered with blank client details"""
+    jobs = []
+    client_names = None
+    for entry in entries:
+        client_name = entry.get('client_name')
+        if not client_name:
+            if client_names is None:
+                client_names = legacy_client_names(details_path)
+            client_name = client_names.get(entry['bill_no'], '')
+        context = build_invoice_context(entry['bill_no'], entry['records'], client_name, entry.get('bill_date'),
+                                        config_service.client_details(client_name),
+                                        config_service.company_profile)
+        jobs.append((entry['bill_no'], context, invoice_file_name(output_path, entry['bill_no'], client_name)))
+    return jobs
+
+
+def open_services():
+    """The config service and invoice store the billing window uses, for the command line tools"""
+    config_service = ConfigService(MasterDataSnapshot(f"{INPUT_FILES_PATH}/User_Input_datas.xlsx",
+                                                      os.path.join(DATABASE_PATH, 'Master_Data_Snapshot.json'))).load()
+    invoice_store = open_invoice_store(DATABASE_PATH, config_service.config_value('storage_engine', 'journal'),
+                                       legacy_file=DATABASE_FILE)
+    return config_service, invoice_store
+
+
+def run(args):
+    config_service, invoice_store = open_services()
+    jobs = build_jobs(select_entries(invoice_store, args), config_service, args.output)
+    if not jobs:
+        print('No bills matched.')
+        return 0
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    template_path = f"{INPUT_FILES_PATH}/invoice_template.html"
+    wkhtmltopdf = config_service.config_value('whtmltopdf')
+    engine = args.engine or configured_invoice_engine(config_service.config_value('invoice_engine'))
+    if engine != 'reportlab':
+        template_environment().get_template(template_path)  # Fills the bytecode cache the workers start from
+    processes = max(1, min(args.processes, len(jobs)))
+    print(f'Rendering {len(jobs)} invoices with {processes} processes ({engine})')
+
+    failed = []
+    cache_hits = 0
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes, initializer=init_render_worker,
+                              initargs=(engine, template_path, wkhtmltopdf, not args.no_cache)) as pool:
+        for done, (bill_no, error, cached, _) in enumerate(pool.imap_unordered(render_job, jobs), start=1):
+            if error is not None:
+                failed.append((bill_no, error))
+            cache_hits += cached
+            if done % args.progress_every == 0 or done == len(jobs):
+                elapsed = time.perf_counter() - started
+                print(f'{done}/{len(jobs)} rendered, {done / elapsed:.1f} invoices/s, {len(failed)} failed')
+
+    elapsed = time.perf_counter() - started
+    print(f'Finished {len(jobs)} invoices in {elapsed:.1f}s ({len(jobs) / elapsed:.1f} invoices/s), '
+          f'{cache_hits} unchanged invoices copied from the render cache')
+    for bill_no, error in failed:
+        print(f'  {bill_no}: {error}')
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--financial-year', action='append', help='yy-yy, may be repeated; all years by default')
+    parser.add_argument('--bill', action='append', help='a single bill number, may be repeated')
+    parser.add_argument('--client', help='only this client')
+    parser.add_argument('--date-from', help='first bill date, YYYY-MM-DD')
+    parser.add_argument('--date-to', help='last bill date, YYYY-MM-DD')
+    parser.add_argument('--output', default=INVOICE_PATH, help='folder the PDFs are written to')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--engine', choices=INVOICE_ENGINES, help="defaults to the Configs sheet's invoice_engine")
+    parser.add_argument('--no-cache', action='store_true', help='render every invoice even if it is unchanged')
+    parser.add_argument('--progress-every', type=int, default=25, help='print progress every N invoices')
+    return run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
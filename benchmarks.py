@@ -0,0 +1,568 @@
+"""Stress tests and benchmarks for the billing app, run from the project folder.
+
+    python benchmarks.py allocator-stress --processes 8 --bills 50 [--rollups]
+    python benchmarks.py price-catalog --rows 50000
+    python benchmarks.py template-render --renders 200 [--pdf]
+    python benchmarks.py invoice-engines --invoices 50 [--wkhtmltopdf PATH]
+    python benchmarks.py pricing --lines 200000
+    python benchmarks.py repricing --bills 50000
+    python benchmarks.py treeview --rows 5000
+    python benchmarks.py amount-words --invoices 20000
+    python benchmarks.py sales-rollups --bills 20000
+    python benchmarks.py legacy-render
+    python benchmarks.py engine-switch
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from bill_number_allocator import BillNumberAllocator
+from invoice_storage import open_invoice_store
+
+SAMPLE_RECORD = {
+    'dress_pattern': 'Blouses', 'piece_name': '', 'layer_name': 'Georget', 'total_cost': 1201.0, 'layer_qnty': 1.0,
+    'layer_price': 1201, 'machine_hours': 0.0, 'machine_cost': 0, 'embroidery_hours': 0.0, 'embroidery_cost': 0,
+    'embroidery_material_cost': 0, 'dying_charges': 0, 'other_cost': 0, 'fixed_cost': 0,
+    'accessories': [('Buttons', 2, 40)],
+}
+SAMPLE_COMPANY_PROFILE = {'Name': 'Malar Vikram', 'Address_Line_1': '1 Main Road', 'Address_Line_2': 'Tiruppur',
+                          'GSTN': '33ABCDE1234F1Z5'}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def allocator_worker(database_path, engine, financial_year, bill_count, terminal, rollups=False):
+    from sales_analytics import SalesRollups
+
+    invoice_store = open_invoice_store(database_path, engine, current_financial_year=financial_year)
+    sales_rollups = SalesRollups(database_path) if rollups else None
+    allocator = BillNumberAllocator(invoice_store, sales_rollups=sales_rollups)
+    saved = []
+    for _ in range(bill_count):
+        started = time.perf_counter()
+        bill_no = allocator.save_invoice(financial_year, [SAMPLE_RECORD], client_name=f'Counter {terminal}',
+                                         bill_date='2024-01-01')
+        saved.append((bill_no, time.perf_counter() - started))
+    return saved
+
+
+def run_allocator_stress(args):
+    database_path = tempfile.mkdtemp(prefix='allocator_stress_')
+    financial_year = '23-24'
+    try:
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.starmap(allocator_worker, [(database_path, args.engine, financial_year, args.bills, n,
+                                                       args.rollups) for n in range(args.processes)])
+        elapsed = time.perf_counter() - started
+
+        saved = [item for result in results for item in result]
+        bill_numbers = sorted(BillNumberAllocator.bill_number(bill_no) for bill_no, _ in saved)
+        expected = list(range(1, args.processes * args.bills + 1))
+        invoice_store = open_invoice_store(database_path, args.engine, current_financial_year=financial_year)
+        stored_bill_nos = [entry['bill_no'] for entry in invoice_store.iter_entries()]
+
+        assert bill_numbers == expected, 'bill numbers were duplicated or skipped'
+        assert sorted(stored_bill_nos) == sorted(bill_no for bill_no, _ in saved), 'store does not match the saves'
+        if args.rollups:
+            from sales_analytics import SalesRollups
+
+            sales_rollups = SalesRollups(database_path).load()
+            assert not sales_rollups.catch_up(invoice_store), 'the sales rollups missed bills'
+            assert sales_rollups.totals()['bills'] == len(saved), 'the sales rollups counted bills twice'
+
+        latencies = [latency * 1000 for _, latency in saved]
+        print(f'{len(saved)} bills from {args.processes} processes ({args.engine}) in {elapsed:.2f}s, '
+              f'no duplicates or gaps')
+        print(f'save latency p50 {percentile(latencies, 0.5):.1f}ms, p99 {percentile(latencies, 0.99):.1f}ms, '
+              f'max {max(latencies):.1f}ms')
+    finally:
+        shutil.rmtree(database_path, ignore_errors=True)
+
+
+def legacy_layer_prices(stock_df):
+    """The iterrows loop PriceCatalog replaced, kept here as the baseline"""
+    import pandas as pd
+
+    layer_price_hash_data = {}
+    for row in stock_df.iterrows():
+        data_dict = row[1].to_dict()
+        piece_rate = data_dict['Selling Price of Material / Mtr']
+        if not pd.isna(piece_rate) and piece_rate != '-':
+            layer_price_hash_data[data_dict['Name of Item']] = piece_rate
+    return layer_price_hash_data
+
+
+def run_price_catalog(args):
+    import numpy as np
+    import pandas as pd
+
+    from price_catalog import PriceCatalog
+
+    rates = np.round(np.random.default_rng(7).uniform(50, 5000, args.rows), 2).astype(object)
+    rates[::17] = '-'
+    rates[::23] = np.nan
+    stock_df = pd.DataFrame({
+        'S. No.': np.arange(1, args.rows + 1),
+        'Name of Item': [f'Item {n}' for n in range(args.rows)],
+        'Selling Price of Material / Mtr': rates,
+    })
+
+    started = time.perf_counter()
+    legacy_prices = legacy_layer_prices(stock_df)
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    catalog = PriceCatalog.from_frames(stock_df=stock_df)
+    catalog_seconds = time.perf_counter() - started
+
+    assert {**catalog.layer_rates, **catalog.accessory_rates} == legacy_prices, 'rates differ from the iterrows build'
+    print(f'{args.rows} stock rows: iterrows {legacy_seconds * 1000:.1f}ms, '
+          f'PriceCatalog {catalog_seconds * 1000:.1f}ms ({legacy_seconds / catalog_seconds:.0f}x faster)')
+
+
+def sample_invoice_context(line_count=12):
+    from invoice_render import build_invoice_context
+
+    records = [{**SAMPLE_RECORD, 'dress_pattern': f'Pattern {n % 5}'} for n in range(line_count)]
+    client_details = {'State': '33-Tamil Nadu', 'Email': 'client@example.com', 'Phone Number': '9876543210'}
+    return build_invoice_context('MV/24-25/1', records, 'Client A', '2024-06-01', client_details,
+                                 SAMPLE_COMPANY_PROFILE)
+
+
+def run_template_render(args):
+    import jinja2
+
+    from invoice_render import render_invoice_html, render_invoice_pdf, template_environment
+
+    template_path = 'Input/invoice_template.html'
+    context = sample_invoice_context()
+
+    started = time.perf_counter()
+    for _ in range(args.renders):
+        # What every invoice used to do
+        template_env = jinja2.Environment(loader=jinja2.FileSystemLoader('./'))
+        fresh_html = template_env.get_template(template_path).render(records=context)
+    fresh_ms = (time.perf_counter() - started) * 1000 / args.renders
+
+    started = time.perf_counter()
+    template_environment().get_template(template_path)
+    prewarm_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for _ in range(args.renders):
+        cached_html = render_invoice_html(context, template_path)
+    cached_ms = (time.perf_counter() - started) * 1000 / args.renders
+
+    assert cached_html == fresh_html, 'the shared environment renders different html'
+    print(f'template per invoice: fresh environment {fresh_ms:.2f}ms, shared environment {cached_ms:.3f}ms '
+          f'({fresh_ms / cached_ms:.0f}x faster), pre-warm {prewarm_ms:.1f}ms once')
+
+    if args.pdf:
+        output_dir = tempfile.mkdtemp(prefix='template_render_')
+        try:
+            pdf_count = min(args.renders, 10)
+            started = time.perf_counter()
+            for n in range(pdf_count):
+                render_invoice_pdf(context, f'{output_dir}/{n}.pdf', template_path, args.wkhtmltopdf)
+            pdf_ms = (time.perf_counter() - started) * 1000 / pdf_count
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        print(f'whole invoice {pdf_ms:.1f}ms, template share {cached_ms / pdf_ms * 100:.2f}% '
+              f'(was {fresh_ms / (pdf_ms - cached_ms + fresh_ms) * 100:.1f}%)')
+
+
+def run_invoice_engines(args):
+    from invoice_render import INVOICE_ENGINES, render_invoice
+
+    context = sample_invoice_context(args.lines)
+    output_dir = tempfile.mkdtemp(prefix='invoice_engines_')
+    try:
+        timings = {}
+        for engine in INVOICE_ENGINES:
+            render_invoice(context, f'{output_dir}/warm-{engine}.pdf', engine, 'Input/invoice_template.html',
+                           args.wkhtmltopdf)
+            latencies = []
+            for n in range(args.invoices):
+                started = time.perf_counter()
+                render_invoice(context, f'{output_dir}/{engine}-{n}.pdf', engine, 'Input/invoice_template.html',
+                               args.wkhtmltopdf)
+                latencies.append((time.perf_counter() - started) * 1000)
+            timings[engine] = latencies
+            print(f'{engine:<12} p50 {percentile(latencies, 0.5):7.1f}ms, p99 {percentile(latencies, 0.99):7.1f}ms, '
+                  f'{args.invoices / (sum(latencies) / 1000):.1f} invoices/s')
+        speedup = percentile(timings['wkhtmltopdf'], 0.5) / percentile(timings['reportlab'], 0.5)
+        print(f'reportlab is {speedup:.1f}x faster at the median')
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def run_pricing(args):
+    import tracemalloc
+
+    from pricing import LineItem, bill_total
+
+    rng = random.Random(7)
+    records = [{**SAMPLE_RECORD, 'layer_price': rng.randint(0, 5000), 'machine_cost': rng.randint(0, 800),
+                'fixed_cost': rng.choice([0, 350]),
+                'accessories': [('Buttons', 2, rng.randint(0, 90))] * rng.randint(0, 3)}
+               for _ in range(args.lines)]
+
+    started = time.perf_counter()
+    line_items = [LineItem.from_record(record) for record in records]
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for line_item in line_items:
+        line_item.price()
+    total = bill_total(line_items)
+    price_seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    sample = [LineItem.from_record(record) for record in records[:10000]]
+    slots_bytes = tracemalloc.get_traced_memory()[0] / len(sample)
+    tracemalloc.stop()
+    tracemalloc.start()
+    dict_sample = [dict(record, accessories=list(record['accessories'])) for record in records[:10000]]
+    dict_bytes = tracemalloc.get_traced_memory()[0] / len(dict_sample)
+    tracemalloc.stop()
+
+    print(f'{args.lines} line items: built in {build_seconds * 1000:.0f}ms, priced in {price_seconds * 1000:.0f}ms '
+          f'({args.lines / price_seconds:,.0f} lines/s), total {total}')
+    print(f'memory per line item: LineItem {slots_bytes:.0f} bytes, record dict {dict_bytes:.0f} bytes')
+
+
+def run_repricing(args):
+    from pricing import hourly_cost, rate_amount
+    from repricing import LineItemArrays, reprice
+
+    rng = random.Random(11)
+    layers = [f'Layer {n}' for n in range(300)]
+    accessories = [f'Accessory {n}' for n in range(60)]
+    old_rates = {name: rng.randint(50, 900) for name in layers + accessories}
+    new_rates = {name: rate * rng.choice([1, 1.08, 0.95]) for name, rate in old_rates.items()}
+
+    entries = []
+    for bill in range(args.bills):
+        records = []
+        for _ in range(rng.randint(1, 8)):
+            layer_name, layer_qnty, machine_hours = rng.choice(layers), rng.randint(1, 30) / 10, rng.choice([0, 0.5, 2])
+            accessory_list = [(name, quantity, rate_amount(old_rates[name], quantity))
+                              for name, quantity in [(rng.choice(accessories), rng.randint(1, 4))] * rng.randint(0, 2)]
+            record = {**SAMPLE_RECORD, 'dress_pattern': f'Pattern {rng.randint(0, 9)}', 'layer_name': layer_name,
+                      'layer_qnty': layer_qnty, 'layer_price': rate_amount(old_rates[layer_name], layer_qnty),
+                      'machine_hours': machine_hours, 'machine_cost': hourly_cost(machine_hours, 750),
+                      'accessories': accessory_list}
+            record['total_cost'] = float(record['layer_price'] + record['machine_cost']
+                                         + sum(accessory[2] for accessory in accessory_list))
+            records.append(record)
+        entries.append({'bill_no': f'MV/24-25/{bill + 1}', 'records': records})
+
+    started = time.perf_counter()
+    expected = []
+    for entry in entries:
+        bill_total = 0
+        for record in entry['records']:
+            delta = rate_amount(new_rates[record['layer_name']], record['layer_qnty']) - record['layer_price']
+            delta += hourly_cost(record['machine_hours'], 800) - record['machine_cost']
+            for name, quantity, price in record['accessories']:
+                delta += rate_amount(new_rates[name], quantity) - price
+            bill_total += int(record['total_cost'] + delta)
+        expected.append(bill_total)
+    loop_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    arrays = LineItemArrays.from_entries(entries)
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    result = reprice(arrays, new_rates, new_rates, machine_rate=800)
+    reprice_seconds = time.perf_counter() - started
+
+    assert result.bill_new.astype(int).tolist() == expected, 'vectorised totals differ from the pricing module'
+    print(f'{len(arrays)} line items in {args.bills} bills: python loop {loop_seconds * 1000:.0f}ms, '
+          f'arrays built in {load_seconds * 1000:.0f}ms, repriced in {reprice_seconds * 1000:.1f}ms')
+
+
+def run_treeview(args):
+    import tkinter as tk
+    from tkinter import ttk
+
+    from treeview_model import TreeviewModel
+
+    root = tk.Tk()
+    rows = [(f'line-{n}', ('Blouses', '', f'Layer {n % 300}', 1201 + n)) for n in range(args.rows)]
+    edits = [rows[n][0] for n in random.Random(3).sample(range(args.rows), args.edits)]
+
+    def rebuild(tree, current):
+        tree.delete(*tree.get_children())
+        for iid, values in current:
+            tree.insert('', 'end', iid=iid, values=values)
+
+    tree = ttk.Treeview(root, columns=('a', 'b', 'c', 'd'), show='headings')
+    current = list(rows)
+    rebuild(tree, current)
+    started = time.perf_counter()
+    for iid in edits:
+        current = [(row_iid, values[:3] + (0,) if row_iid == iid else values) for row_iid, values in current]
+        rebuild(tree, current)
+        root.update_idletasks()
+    rebuild_seconds = time.perf_counter() - started
+    tree.destroy()
+
+    tree = ttk.Treeview(root, columns=('a', 'b', 'c', 'd'), show='headings')
+    model = TreeviewModel(tree)
+    model.set_rows(rows)
+    model.flush()
+    started = time.perf_counter()
+    for iid in edits:
+        model.upsert(iid, model.rows[iid][:3] + (0,))
+        root.update_idletasks()
+    model_seconds = time.perf_counter() - started
+    rendered = len(tree.get_children())
+    root.destroy()
+
+    print(f'{args.edits} edits of a {args.rows} row grid: full rebuild {rebuild_seconds * 1000 / args.edits:.1f}ms '
+          f'per edit, view model {model_seconds * 1000 / args.edits:.2f}ms per edit ({rendered} rows rendered)')
+
+
+AMOUNT_WORDS_REFERENCE = [
+    (0, 'Rupees Zero Only'),
+    (10, 'Rupees Ten Only'),
+    (19, 'Rupees Nineteen Only'),
+    (105, 'Rupees One Hundred and Five Only'),
+    (1005, 'Rupees One Thousand Five Only'),
+    (1261.05, 'Rupees One Thousand Two Hundred and Sixty One and Five Paise Only'),
+    (99999.999, 'Rupees One Lakh Only'),
+    (100000, 'Rupees One Lakh Only'),
+    (1234567.5, 'Rupees Twelve Lakh Thirty Four Thousand Five Hundred and Sixty Seven and Fifty Paise Only'),
+    (10 ** 7, 'Rupees One Crore Only'),
+    (12345678, 'Rupees One Crore Twenty Three Lakh Forty Five Thousand Six Hundred and Seventy Eight Only'),
+    (10 ** 9, 'Rupees One Hundred Crore Only'),
+    (0.01, 'Rupees Zero and One Paise Only'),
+    (-40.5, 'Minus Rupees Forty and Fifty Paise Only'),
+]
+
+
+def run_amount_words(args):
+    from amount_words import amount_in_words
+    from invoice_render import GST_RATE
+
+    for amount, expected in AMOUNT_WORDS_REFERENCE:
+        assert amount_in_words(amount) == expected, f'{amount}: {amount_in_words(amount)!r} != {expected!r}'
+
+    # Invoice values of a batch, taxable values repeat a lot between bills
+    rng = random.Random(5)
+    amounts = []
+    for _ in range(args.invoices):
+        taxable_value = rng.choice([rng.randint(500, 50000), rng.randint(1, 200) * 500])
+        amounts.append(taxable_value + round(taxable_value * GST_RATE, 2))
+
+    amount_in_words.cache_clear()
+    started = time.perf_counter()
+    for amount in amounts:
+        amount_in_words.__wrapped__(amount)
+    uncached_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for amount in amounts:
+        amount_in_words(amount)
+    cached_seconds = time.perf_counter() - started
+
+    print(f'{len(AMOUNT_WORDS_REFERENCE)} reference amounts match')
+    print(f'{args.invoices} invoice values: {args.invoices / uncached_seconds:,.0f}/s uncached, '
+          f'{args.invoices / cached_seconds:,.0f}/s through the cache ({amount_in_words.cache_info().hits} hits)')
+
+
+def run_sales_rollups(args):
+    from sales_analytics import SalesRollups
+
+    database_path = tempfile.mkdtemp(prefix='sales_rollups_')
+    financial_year = '24-25'
+    rng = random.Random(9)
+    clients = [f'Client {n}' for n in range(200)]
+    try:
+        invoice_store = open_invoice_store(database_path, args.engine, current_financial_year=financial_year)
+        sales_rollups = SalesRollups(database_path)
+        allocator = BillNumberAllocator(invoice_store, sales_rollups=sales_rollups)
+        latencies = {True: [], False: []}
+        for bill in range(args.bills):
+            # Every tenth save skips the rollups, which the next save then has to catch up on
+            allocator.sales_rollups = sales_rollups if bill % 10 else None
+            records = [{**SAMPLE_RECORD, 'dress_pattern': f'Pattern {rng.randint(0, 20)}',
+                        'layer_name': f'Layer {rng.randint(0, 300)}', 'machine_hours': rng.choice([0, 0.5, 2])}
+                       for _ in range(rng.randint(1, 8))]
+            started = time.perf_counter()
+            allocator.save_invoice(financial_year, records, client_name=rng.choice(clients),
+                                   bill_date=f'2024-{rng.randint(4, 12):02d}-{rng.randint(1, 28):02d}')
+            if bill % 10 and (bill - 1) % 10:
+                latencies[True].append((time.perf_counter() - started) * 1000)
+            elif not bill % 10:
+                latencies[False].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        sales_rollups = SalesRollups(database_path).refresh(invoice_store)
+        report = sales_rollups.report('client')
+        rollup_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scanned = SalesRollups(database_path, 'Scanned_Rollups.json')
+        scanned.catch_up(invoice_store)
+        scan_seconds = time.perf_counter() - started
+
+        assert scanned.report('client') == report, 'the incremental rollups differ from a full scan'
+        print(f'{args.bills} bills ({args.engine}): save p50 {percentile(latencies[False], 0.5):.1f}ms without '
+              f'rollups, {percentile(latencies[True], 0.5):.1f}ms with them')
+        print(f'dashboard from the rollups {rollup_seconds * 1000:.1f}ms, full scan of every bill '
+              f'{scan_seconds * 1000:.0f}ms, same figures')
+    finally:
+        shutil.rmtree(database_path, ignore_errors=True)
+
+
+def run_legacy_render(args):
+    import json
+
+    from batch_render import build_jobs
+    from invoice_render import render_invoice
+    from master_data import ConfigService
+
+    database_path = tempfile.mkdtemp(prefix='legacy_render_')
+    try:
+        # The {bill_no: records} file the first versions saved, one bill has a Bill Details workbook
+        with open(os.path.join(database_path, 'Invoice_Datas.json'), 'w', encoding='utf-8') as f:
+            json.dump({'results': [{'MV/23-24/1': [SAMPLE_RECORD]}, {'MV/23-24/2': [SAMPLE_RECORD]}],
+                       '23-24_last_bill_no': '2'}, f)
+        details_path = os.path.join(database_path, 'Bill Details')
+        os.makedirs(details_path)
+        open(os.path.join(details_path, 'MV_23-24_2_Client B.xlsx'), 'wb').close()
+
+        invoice_store = open_invoice_store(database_path, args.engine, current_financial_year='24-25')
+        config_service = ConfigService(None)
+        config_service.set_master_data({'company_profile': SAMPLE_COMPANY_PROFILE,
+                                        'clients': {}, 'configs': {}}, None)
+        output_path = os.path.join(database_path, 'Invoices')
+        os.makedirs(output_path)
+        jobs = build_jobs(invoice_store.iter_entries(), config_service, output_path, details_path)
+        for bill_no, context, pdf_path in jobs:
+            render_invoice(context, pdf_path, 'reportlab')
+
+        pdfs = sorted(os.listdir(output_path))
+        assert pdfs == ['MV_23-24_1.pdf', 'MV_23-24_2_Client B.pdf'], pdfs
+        print(f'{len(pdfs)} migrated legacy bills rendered ({args.engine}): {", ".join(pdfs)}')
+    finally:
+        shutil.rmtree(database_path, ignore_errors=True)
+
+
+def close_partitions(invoice_store):
+    for store in invoice_store.partitions.values():
+        if hasattr(store, 'close'):
+            store.close()
+
+
+def run_engine_switch(args):
+    database_path = tempfile.mkdtemp(prefix='engine_switch_')
+    financial_year = '24-25'
+    saved = []
+    try:
+        # A typo in the storage_engine row falls back to the journal
+        for engine in ['sqlite', 'journal', 'sqlite', 'Sqlte', 'sqlite']:
+            invoice_store = open_invoice_store(database_path, engine, current_financial_year=financial_year)
+            allocator = BillNumberAllocator(invoice_store)
+            for _ in range(args.bills):
+                saved.append(allocator.save_invoice(financial_year, [SAMPLE_RECORD], bill_date='2024-05-01'))
+            stored = [entry['bill_no'] for entry in invoice_store.iter_entries()]
+            assert stored == saved, f'{engine}: {len(stored)} bills stored, {len(saved)} saved'
+            close_partitions(invoice_store)
+
+        assert len(set(saved)) == len(saved), 'a bill number was handed out twice'
+        print(f'{len(saved)} bills saved across engine switches, numbers {saved[0]} to {saved[-1]}')
+
+        # A year closed by one engine is still read after switching to the other
+        for closed_by, opened_by in [('sqlite', 'journal'), ('journal', 'sqlite')]:
+            store_path = os.path.join(database_path, f'closed_by_{closed_by}')
+            invoice_store = open_invoice_store(store_path, closed_by, current_financial_year='23-24')
+            allocator = BillNumberAllocator(invoice_store)
+            closed = [allocator.save_invoice('23-24', [SAMPLE_RECORD], bill_date='2024-03-01')
+                      for _ in range(args.bills)]
+            close_partitions(invoice_store)
+            close_partitions(open_invoice_store(store_path, closed_by, current_financial_year=financial_year))
+
+            invoice_store = open_invoice_store(store_path, opened_by, current_financial_year=financial_year)
+            assert invoice_store.is_closed('23-24')
+            assert [entry['bill_no'] for entry in invoice_store.find_invoices(['23-24'])] == closed
+            assert invoice_store.last_bill_no('23-24') == len(closed)
+            assert invoice_store.get_invoice(closed[-1])['bill_no'] == closed[-1]
+            close_partitions(invoice_store)
+            print(f'{len(closed)} bills of a year closed by {closed_by} read with {opened_by}')
+    finally:
+        shutil.rmtree(database_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stress_parser = subparsers.add_parser('allocator-stress', help='many processes saving bills at the same time')
+    stress_parser.add_argument('--processes', type=int, default=8)
+    stress_parser.add_argument('--bills', type=int, default=50, help='bills saved by each process')
+    stress_parser.add_argument('--engine', default='journal', choices=['journal', 'sqlite'])
+    stress_parser.add_argument('--rollups', action='store_true', help='also update and check the sales rollups')
+    stress_parser.set_defaults(func=run_allocator_stress)
+
+    catalog_parser = subparsers.add_parser('price-catalog', help='PriceCatalog build against the iterrows loop')
+    catalog_parser.add_argument('--rows', type=int, default=50000, help='rows in the generated stock statement')
+    catalog_parser.set_defaults(func=run_price_catalog)
+
+    template_parser = subparsers.add_parser('template-render', help='shared Jinja environment against a fresh one')
+    template_parser.add_argument('--renders', type=int, default=200)
+    template_parser.add_argument('--pdf', action='store_true', help='also time whole PDFs through wkhtmltopdf')
+    template_parser.add_argument('--wkhtmltopdf', help='path of the wkhtmltopdf binary, if not on PATH')
+    template_parser.set_defaults(func=run_template_render)
+
+    engines_parser = subparsers.add_parser('invoice-engines', help='wkhtmltopdf against the ReportLab engine')
+    engines_parser.add_argument('--invoices', type=int, default=50)
+    engines_parser.add_argument('--lines', type=int, default=12, help='line items on each invoice')
+    engines_parser.add_argument('--wkhtmltopdf', help='path of the wkhtmltopdf binary, if not on PATH')
+    engines_parser.set_defaults(func=run_invoice_engines)
+
+    pricing_parser = subparsers.add_parser('pricing', help='headless line item pricing throughput and memory')
+    pricing_parser.add_argument('--lines', type=int, default=200000)
+    pricing_parser.set_defaults(func=run_pricing)
+
+    repricing_parser = subparsers.add_parser('repricing', help='vectorised what-if repricing against a python loop')
+    repricing_parser.add_argument('--bills', type=int, default=50000)
+    repricing_parser.set_defaults(func=run_repricing)
+
+    treeview_parser = subparsers.add_parser('treeview', help='diffed grid updates against rebuilding it, needs a display')
+    treeview_parser.add_argument('--rows', type=int, default=5000)
+    treeview_parser.add_argument('--edits', type=int, default=50)
+    treeview_parser.set_defaults(func=run_treeview)
+
+    words_parser = subparsers.add_parser('amount-words', help='amount in words against a reference table, throughput')
+    words_parser.add_argument('--invoices', type=int, default=20000)
+    words_parser.set_defaults(func=run_amount_words)
+
+    rollups_parser = subparsers.add_parser('sales-rollups', help='incremental sales rollups against a full scan')
+    rollups_parser.add_argument('--bills', type=int, default=20000)
+    rollups_parser.add_argument('--engine', default='journal', choices=['journal', 'sqlite'])
+    rollups_parser.set_defaults(func=run_sales_rollups)
+
+    legacy_parser = subparsers.add_parser('legacy-render', help='bills migrated from the old json file render')
+    legacy_parser.add_argument('--engine', default='journal', choices=['journal', 'sqlite'])
+    legacy_parser.set_defaults(func=run_legacy_render)
+
+    switch_parser = subparsers.add_parser('engine-switch', help='bill numbers carry on when storage_engine changes')
+    switch_parser.add_argument('--bills', type=int, default=3, help='bills saved between switches')
+    switch_parser.set_defaults(func=run_engine_switch)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+
+from invoice_journal import parse_bill_no
+
+
+class BillNumberAllocator:
+    """Hands out 'MV/yy-yy/N' at save time instead of trusting the number worked out at start up.
+
+    The next number is read from the store and the bill is written while the store's
+    file lock is held, so two counters can never save the same number. A number is only
+    used once its bill is on disk: a crash inside reserve() leaves no gap and no duplicate.
+    """
+
+    def __init__(self, invoice_store, prefix='MV', sales_rollups=None):
+        self.invoice_store = invoice_store
+        self.prefix = prefix
+        self.sales_rollups = sales_rollups
+
+    def peek_next_bill_no(self, financial_year):
+        """Next number as things stand now, for display only; another counter may take it first"""
+        self.invoice_store.refresh()
+        return self.invoice_store.last_bill_no(financial_year) + 1
+
+    @contextmanager
+    def reserve(self, financial_year):
+        with self.invoice_store.lock:
+            self.invoice_store.refresh()
+            bill_number = self.invoice_store.last_bill_no(financial_year) + 1
+            yield f'{self.prefix}/{financial_year}/{bill_number}'
+
+    def save_invoice(self, financial_year, records, client_name=None, bill_date=None):
+        """Reserves the next bill number, saves the bill under it and returns the number used"""
+        with self.reserve(financial_year) as bill_no:
+            self.invoice_store.append_invoice(bill_no, records, client_name=client_name, bill_date=bill_date)
+            if self.sales_rollups is not None:
+                # Derived data: the bill is saved, a failure here must not look like a failed save
+                try:
+                    self.sales_rollups.record_invoice(self.invoice_store, bill_no, records, client_name, bill_date)
+                except Exception as e:
+                    print(f'{bill_no} is saved but the sales rollups were not updated '
+                          f'({type(e).__name__}: {e}), they catch up the next time they are read')
+        return bill_no
+
+    @staticmethod
+    def bill_number(bill_no):
+        return parse_bill_no(bill_no)[1]
@@ -0,0 +1,162 @@
+"""Writes one PDF statement with every bill of a client in a period.
+
+    python client_statement.py --client "Client A" --date-from 2024-04-01 --date-to 2024-04-30
+    python client_statement.py --client "Client A" --financial-year 24-25 --output "Statements/Client A 24-25.pdf"
+"""
+import argparse
+import os
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Frame, Spacer, Table, TableStyle
+from reportlab.platypus.doctemplate import LayoutError
+
+from batch_render import open_services
+from invoice_render import build_invoice_context
+from reportlab_invoice import GRID_STYLE, PAGE_WIDTH, bold, cell, center_style, items_table, text, title_style
+
+MARGIN = 15 * mm
+
+
+def amount(value):
+    return f'{value:,.2f}'
+
+
+class StatementWriter:
+    """Lays sections out page by page straight onto a canvas.
+
+    Unlike SimpleDocTemplate.build, which needs every flowable up front, each bill's
+    tables are drawn and dropped before the next bill is read, so the layout work is
+    bounded per bill. The statement as a whole is not: the canvas keeps every finished
+    page, compressed, until save() writes the file, about 3 KB a bill.
+    """
+
+    def __init__(self, output_path, title):
+        self.canvas = canvas.Canvas(output_path, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.title = title
+        self.page_number = 1
+        self.frame = None
+        self.frame_empty = True
+        self.new_frame()
+
+    def new_frame(self):
+        self.frame = Frame(MARGIN, MARGIN + 8 * mm, A4[0] - 2 * MARGIN, A4[1] - 2 * MARGIN - 8 * mm,
+                           leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+        self.frame_empty = True
+
+    def finish_page(self):
+        self.canvas.setFont('Helvetica', 8)
+        self.canvas.drawString(MARGIN, MARGIN, self.title)
+        self.canvas.drawRightString(A4[0] - MARGIN, MARGIN, f'Page {self.page_number}')
+        self.canvas.showPage()
+        self.page_number += 1
+        self.new_frame()
+
+    def draw(self, flowables):
+        flowables = list(flowables)
+        while flowables:
+            head = flowables.pop(0)
+            if self.frame.add(head, self.canvas):
+                self.frame_empty = False
+                continue
+            parts = self.frame.split(head, self.canvas)
+            if len(parts) > 1:
+                # A long table continues on the next page with its header row repeated
+                flowables[:0] = parts
+                continue
+            if self.frame_empty:
+                raise LayoutError(f'{head.__class__.__name__} is taller than a page')
+            self.finish_page()
+            flowables.insert(0, head)
+
+    def save(self):
+        self.finish_page()
+        self.canvas.save()
+
+
+def summary_table(rows, right_align=True):
+    table = Table(rows, colWidths=[PAGE_WIDTH * 0.47, PAGE_WIDTH * 0.53])
+    table.setStyle(TableStyle(GRID_STYLE + ([('ALIGN', (1, 0), (1, -1), 'RIGHT')] if right_align else [])))
+    return table
+
+
+def write_client_statement(entries, output_path, client_name, client_details, company_profile, period=''):
+    """Streams the bills from entries (any iterable, oldest first) into one PDF, returns the totals"""
+    title = f'Statement of Account - {client_name}' + (f' - {period}' if period else '')
+    writer = StatementWriter(output_path, title)
+    writer.draw([
+        cell(bold(company_profile.get('Name', '')), title_style),
+        cell(f"<i>{text(company_profile.get('Address_Line_1', ''))}</i>", center_style),
+        cell(f"<i>{text(company_profile.get('Address_Line_2', ''))}</i>", center_style),
+        cell(bold(f"GSTN : {company_profile.get('GSTN', '')}"), center_style),
+        Spacer(1, 6 * mm),
+        cell(bold('Statement of Account'), title_style),
+        cell(f"{bold('Client: ')}{text(client_name)}" + (f"&nbsp;&nbsp;{bold('Period: ')}{text(period)}"
+                                                        if period else ''), center_style),
+        Spacer(1, 8 * mm),
+    ])
+
+    totals = {'bills': 0, 'taxable_value': 0, 'tax': 0, 'invoice_value': 0}
+    for entry in entries:
+        records = build_invoice_context(entry['bill_no'], entry['records'], client_name, entry.get('bill_date'),
+                                        client_details, company_profile)
+        totals['bills'] += 1
+        totals['taxable_value'] += records['total_cost_for_client']
+        totals['tax'] += records['other_charges']
+        totals['invoice_value'] += records['invoice_value']
+        writer.draw([
+            cell(f"{bold('Bill No: ' + records['bill_no'])}&nbsp;&nbsp;&nbsp;{bold('Bill Date: ')}"
+                 f"{text(records['bill_date'])}"),
+            Spacer(1, 2 * mm),
+            items_table(records),
+            summary_table([
+                ['Taxable Value', amount(records['total_cost_for_client'])],
+                ['Other Charges', amount(records['other_charges'])],
+                [cell(bold('Invoice Value')), amount(records['invoice_value'])],
+                [f"Running total after {totals['bills']} bill{'s' if totals['bills'] > 1 else ''}",
+                 amount(totals['invoice_value'])],
+            ]),
+            Spacer(1, 8 * mm),
+        ])
+
+    writer.draw([
+        cell(bold('Summary'), title_style),
+        Spacer(1, 2 * mm),
+        summary_table([
+            ['Bills', str(totals['bills'])],
+            ['Taxable Value', amount(totals['taxable_value'])],
+            ['Other Charges', amount(totals['tax'])],
+            [cell(bold('Total Invoice Value')), amount(totals['invoice_value'])],
+        ]),
+    ])
+    writer.save()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--client', required=True)
+    parser.add_argument('--financial-year', action='append', help='yy-yy, may be repeated; all years by default')
+    parser.add_argument('--date-from', help='first bill date, YYYY-MM-DD')
+    parser.add_argument('--date-to', help='last bill date, YYYY-MM-DD')
+    parser.add_argument('--output', help='PDF to write, Invoices/Statement_<client>.pdf by default')
+    args = parser.parse_args()
+
+    config_service, invoice_store = open_services()
+    period = ' to '.join(filter(None, [args.date_from, args.date_to])) or ', '.join(args.financial_year or [])
+    output_path = args.output or f'Invoices/Statement_{args.client}.pdf'
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    entries = invoice_store.find_invoices(financial_years=args.financial_year, client_name=args.client,
+                                          date_from=args.date_from, date_to=args.date_to)
+    totals = write_client_statement(entries, output_path, args.client, config_service.client_details(args.client),
+                                    config_service.company_profile, period)
+    print(f"{output_path}: {totals['bills']} bills, invoice value {amount(totals['invoice_value'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+
+if os.name == 'nt':
+    import msvcrt
+
+
+    def lock_file(file):
+        file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.005)
+
+
+    def unlock_file(file):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+
+    def lock_file(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+
+    def unlock_file(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class FileLock:
+    """Exclusive OS level lock on a file, shared by every billing counter using the same Database folder.
+
+    The OS drops the lock when a process dies, so a crashed counter never blocks the others.
+    It is re-entrant inside one process, so the store and the allocator can both take it.
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            try:
+                self.file = open(self.lock_path, 'a+b')
+                lock_file(self.file)
+            except Exception:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            unlock_file(self.file)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
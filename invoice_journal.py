@@ -0,0 +1,328 @@
+import json
+import os
+import threading
+
+from file_lock import FileLock
+
+
+def parse_bill_no(bill_no):
+    """Splits 'MV/23-24/2' into ('23-24', 2). Returns (None, None) for anything else."""
+    parts = str(bill_no).split('/')
+    if len(parts) != 3:
+        return None, None
+    try:
+        return parts[1], int(parts[2])
+    except ValueError:
+        return parts[1], None
+
+
+def write_json_atomic(path, json_data):
+    """Writes json to a temp file, fsyncs it and swaps it in so readers never see half a file.
+
+    The temp file is unique per process and thread, so writers that hold no lock (two counters
+    refreshing the master data snapshot at once) never share one; the last rename wins.
+    """
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(json_data))  # dumps encodes in C, dump streams through the pure python encoder
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class InvoiceJournal:
+    """Append-only invoice store.
+
+    Every saved bill is one JSON line in the journal, so a save costs the size of
+    that bill instead of the whole history. The '{fy}_last_bill_no' counters live
+    in a small sidecar next to it, together with the journal size they cover, so a
+    crash between the two writes is repaired on the next open.
+
+    An append-only index file maps every bill number to the offset and length of its
+    line, so get_invoice reads one line instead of the whole history.
+    """
+
+    def __init__(self, database_path, journal_file='Invoice_Datas.jsonl', counters_file='Invoice_Counters.json',
+                 legacy_file='Invoice_Datas.json', lock_file='Invoice_Datas.lock', index_file='Invoice_Index.tsv',
+                 read_only=False, import_from_sqlite=True):
+        self.database_path = database_path
+        self.journal_path = os.path.join(database_path, journal_file)
+        self.counters_path = os.path.join(database_path, counters_file)
+        self.legacy_path = os.path.join(database_path, legacy_file)
+        self.index_path = os.path.join(database_path, index_file)
+        self.lock = FileLock(os.path.join(database_path, lock_file))
+        self.counters = {}
+        self.index = {}
+        self.indexed_size = 0
+        self.index_file_position = 0
+        self.read_only = read_only
+        self.import_from_sqlite = import_from_sqlite
+
+    def open(self):
+        if self.read_only:
+            # A closed partition is compacted with a complete index, there is nothing to repair
+            self.counters = self.read_counters()
+            if os.path.exists(self.index_path):
+                self.read_index_file()
+            return self
+        if not os.path.exists(self.database_path):
+            os.makedirs(self.database_path)
+        with self.lock:
+            if not os.path.exists(self.journal_path):
+                if os.path.exists(self.legacy_path):
+                    self.migrate_legacy()
+                elif self.import_from_sqlite and os.path.exists(self.sqlite_path()):
+                    self.import_sqlite()
+            elif self.import_from_sqlite and os.path.exists(self.sqlite_path()):
+                # A crash after an import left the sqlite files behind, the journal already has their bills
+                self.retire_sqlite()
+            self.recover()
+        return self
+
+    def refresh(self):
+        """Picks up bills saved by other counters sharing the Database folder"""
+        if self.read_only:
+            return
+        with self.lock:
+            self.recover()
+
+    def migrate_legacy(self):
+        """One time conversion of the old {'results': [...], '{fy}_last_bill_no': n} file"""
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            legacy_datas = json.load(f)
+
+        self.write_journal((self.encode_entry(bill_no, records)
+                            for result in legacy_datas.get('results', []) for bill_no, records in result.items()),
+                           {key: int(value) for key, value in legacy_datas.items() if key.endswith('_last_bill_no')})
+
+        # Keep the old file around as a backup, but out of the way of the next start up
+        os.replace(self.legacy_path, f'{self.legacy_path}.migrated')
+
+    def sqlite_path(self):
+        from invoice_sqlite import SqliteInvoiceStore
+        return SqliteInvoiceStore(self.database_path).sqlite_path
+
+    def import_sqlite(self):
+        """Copies bills from the sqlite store when the journal engine is picked again after it, like sqlite does"""
+        from invoice_sqlite import SqliteInvoiceStore
+        sqlite_store = SqliteInvoiceStore(self.database_path, read_only=True).open()
+        try:
+            self.write_journal((self.encode_entry(entry['bill_no'], entry['records'], entry.get('client_name'),
+                                                  entry.get('bill_date')) for entry in sqlite_store.iter_entries()),
+                               {key: int(value) for key, value in sqlite_store.load().items()
+                                if key.endswith('_last_bill_no')})
+        finally:
+            sqlite_store.close()
+        self.retire_sqlite()
+
+    def retire_sqlite(self):
+        """Moves the sqlite files aside as a backup, so switching engines again does not read stale bills"""
+        from invoice_sqlite import SqliteInvoiceStore
+        for path in SqliteInvoiceStore(self.database_path).data_files():
+            if os.path.exists(path):
+                os.replace(path, f'{path}.migrated')
+
+    def write_journal(self, lines, counters):
+        """Writes a whole new journal and its counters; the journal appears in one rename once it is on disk"""
+        temp_path = f'{self.journal_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            journal_size = f.tell()
+        counters['journal_size'] = journal_size
+        write_json_atomic(self.counters_path, counters)
+        os.replace(temp_path, self.journal_path)
+
+    def recover(self):
+        """Drops a torn last line and replays any records the counters sidecar and the index have not seen yet"""
+        self.counters = self.read_counters()
+        if not os.path.exists(self.journal_path):
+            self.counters['journal_size'] = 0
+            self.update_index(0)
+            return
+
+        with open(self.journal_path, 'rb+') as f:
+            journal_size = f.seek(0, os.SEEK_END)
+            if journal_size:
+                f.seek(journal_size - 1)
+                if f.read(1) != b'\n':
+                    # An append that never reached its fsync, nothing was acknowledged for it
+                    f.seek(0)
+                    valid_size = f.read().rfind(b'\n') + 1
+                    f.truncate(valid_size)
+                    journal_size = valid_size
+
+        covered_size = self.counters.get('journal_size', 0)
+        if covered_size > journal_size:
+            covered_size = 0
+            self.counters = {}
+        if covered_size != journal_size:
+            for entry in self.iter_entries(start=covered_size):
+                self.update_counters(entry['bill_no'])
+            self.counters['journal_size'] = journal_size
+            write_json_atomic(self.counters_path, self.counters)
+
+        self.update_index(journal_size)
+
+    def update_index(self, journal_size):
+        """Reads index lines written since the last call and indexes any journal tail they do not cover.
+
+        The index is rebuilt from the journal when it is missing or points past the end of it.
+        """
+        if not os.path.exists(self.index_path):
+            self.reset_index()
+        else:
+            if os.path.getsize(self.index_path) < self.index_file_position:
+                # Another counter rebuilt the index file, read it again from the start
+                self.index = {}
+                self.indexed_size = 0
+                self.index_file_position = 0
+            self.read_index_file()
+
+        if self.indexed_size > journal_size:
+            self.reset_index()
+        if self.indexed_size == journal_size:
+            return
+
+        with open(self.index_path, 'ab') as f:
+            for offset, length, entry in self.iter_entries_with_offsets(start=self.indexed_size):
+                self.add_to_index(f, entry['bill_no'], offset, length)
+
+    def read_index_file(self):
+        with open(self.index_path, 'rb') as f:
+            f.seek(self.index_file_position)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                bill_no, offset, length = line.decode('utf-8').rstrip('\n').split('\t')
+                self.index[bill_no] = (int(offset), int(length))
+                self.indexed_size = max(self.indexed_size, int(offset) + int(length))
+                self.index_file_position += len(line)
+
+    def reset_index(self):
+        with open(self.index_path, 'wb'):
+            pass
+        self.index = {}
+        self.indexed_size = 0
+        self.index_file_position = 0
+
+    def add_to_index(self, index_file, bill_no, offset, length):
+        line = f'{bill_no}\t{offset}\t{length}\n'.encode('utf-8')
+        index_file.write(line)
+        self.index[bill_no] = (offset, length)
+        self.indexed_size = max(self.indexed_size, offset + length)
+        self.index_file_position += len(line)
+
+    def read_counters(self):
+        if os.path.exists(self.counters_path):
+            with open(self.counters_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def update_counters(self, bill_no):
+        financial_year, bill_number = parse_bill_no(bill_no)
+        if bill_number is None:
+            return
+        last_num_key = f'{financial_year}_last_bill_no'
+        self.counters[last_num_key] = max(int(self.counters.get(last_num_key, 0)), bill_number)
+
+    @staticmethod
+    def encode_entry(bill_no, records, client_name=None, bill_date=None):
+        entry = {
+            'bill_no': bill_no,
+            'client_name': client_name,
+            'bill_date': bill_date,
+            'records': records,
+        }
+        return json.dumps(entry, separators=(',', ':')) + '\n'
+
+    def append_invoice(self, bill_no, records, client_name=None, bill_date=None):
+        if self.read_only:
+            raise PermissionError(f"Invoice journal in '{self.database_path}' is closed for new bills")
+        line = self.encode_entry(bill_no, records, client_name, bill_date).encode('utf-8')
+        with self.lock:
+            with open(self.journal_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+                journal_size = f.tell()
+
+            self.update_counters(bill_no)
+            self.counters['journal_size'] = journal_size
+            write_json_atomic(self.counters_path, self.counters)
+
+            # The index is not fsync'd, a lost tail is simply re-indexed from the journal on the next open
+            if self.indexed_size == offset:
+                with open(self.index_path, 'ab') as f:
+                    self.add_to_index(f, bill_no, offset, len(line))
+            else:
+                self.update_index(journal_size)
+
+    def compact(self):
+        """Rewrites the journal with only the last save of every bill, in bill number order"""
+        with self.lock:
+            self.recover()
+            locations = sorted(self.index.items(), key=lambda item: (parse_bill_no(item[0])[1] or 0, item[1][0]))
+            temp_path = f'{self.journal_path}.tmp'
+            with open(self.journal_path, 'rb') as source, open(temp_path, 'wb') as target:
+                for bill_no, (offset, length) in locations:
+                    source.seek(offset)
+                    target.write(source.read(length))
+                target.flush()
+                os.fsync(target.fileno())
+                journal_size = target.tell()
+            os.replace(temp_path, self.journal_path)
+
+            self.counters['journal_size'] = journal_size
+            write_json_atomic(self.counters_path, self.counters)
+            self.reset_index()
+            self.update_index(journal_size)
+
+    def data_files(self):
+        return [self.journal_path, self.counters_path, self.index_path]
+
+    def last_bill_no(self, financial_year):
+        return int(self.counters.get(f'{financial_year}_last_bill_no', 0))
+
+    def iter_entries_with_offsets(self, start=0):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb') as f:
+            offset = f.seek(start)
+            for line in f:
+                if line.strip():
+                    yield offset, len(line), json.loads(line)
+                offset += len(line)
+
+    def iter_entries(self, start=0):
+        """Yields the full journal entries (bill_no, client_name, bill_date, records) in save order"""
+        for _, _, entry in self.iter_entries_with_offsets(start):
+            yield entry
+
+    def get_invoice(self, bill_no):
+        """Returns the journal entry of one bill, or None, with a single seek into the journal"""
+        location = self.index.get(bill_no)
+        if location is None and not self.read_only:
+            self.refresh()
+            location = self.index.get(bill_no)
+        if location is None:
+            return None
+        offset, length = location
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def iter_results(self):
+        for entry in self.iter_entries():
+            yield {entry['bill_no']: entry['records']}
+
+    def load(self):
+        """Returns the same {'results': [...], '{fy}_last_bill_no': n} structure the old json file had"""
+        database_datas = {'results': list(self.iter_results())}
+        for key, value in self.counters.items():
+            if key.endswith('_last_bill_no'):
+                database_datas[key] = str(value)
+        return database_datas
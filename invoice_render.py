@@ -0,0 +1,253 @@
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+from amount_words import amount_in_words
+from pricing import bill_total
+from render_cache import wkhtmltopdf_version
+
+GST_RATE = 0.05
+INVOICE_ENGINES = ('wkhtmltopdf', 'reportlab')
+TEMPLATE_CACHE_PATH = os.path.join('Database', 'Template_Cache')
+
+template_environments = {}
+template_environments_lock = threading.Lock()
+
+
+def group_dress_records(records):
+    """Total cost per dress pattern, sorted by pattern like the old pandas groupby"""
+    totals = {}
+    for record in records:
+        totals[record['dress_pattern']] = totals.get(record['dress_pattern'], 0) + record['total_cost']
+    return [{'s_no': s_no, 'dress_pattern': dress_pattern, 'total_cost': total_cost}
+            for s_no, (dress_pattern, total_cost) in enumerate(sorted(totals.items()), start=1)]
+
+
+def build_invoice_context(bill_no, records, client_name, bill_date, client_details, company_profile,
+                          taxable_value=None):
+    """The customer_details dict invoice_template.html is rendered with.
+
+    bill_date is a date, an ISO date string or None for bills saved before dates were
+    stored. taxable_value defaults to the sum of the line totals, the screen passes its
+    own running total.
+    """
+    if taxable_value is None:
+        taxable_value = bill_total(records)
+    if isinstance(bill_date, str):
+        bill_date = datetime.date.fromisoformat(bill_date[:10])
+    tax_value = round(taxable_value * GST_RATE, 2)
+    total_value = taxable_value + tax_value
+
+    return {
+        'company_name': company_profile['Name'],
+        'address_line_1': company_profile['Address_Line_1'],
+        'address_line_2': company_profile['Address_Line_2'],
+        'gstn_no': company_profile['GSTN'],
+        'name': client_name,
+        'bill_no': bill_no,
+        'bill_date': bill_date.strftime("%d-%m-%Y") if bill_date else '',
+        'state': client_details.get('State', ''),
+        'email_id': client_details.get('Email', ''),
+        'phone_number': client_details.get('Phone Number', ''),
+        'dress_records': group_dress_records(records),
+        'other_charges': tax_value,
+        'amount_receivable': total_value,
+        'amount_in_words': amount_in_words(total_value),
+        'invoice_value': total_value,
+        'total_cost_for_client': taxable_value,
+    }
+
+
+def invoice_file_name(invoice_path, bill_no, client_name):
+    if not client_name:
+        return f"{invoice_path}/{bill_no.replace('/', '_')}.pdf"
+    return f"{invoice_path}/{bill_no.replace('/', '_')}_{client_name}.pdf"
+
+
+def template_environment(search_path='./', cache_path=TEMPLATE_CACHE_PATH):
+    """One Jinja environment per process, shared by every render.
+
+    Compiled templates stay in memory and their bytecode is cached on disk, so a
+    fresh process skips parsing too. auto_reload compares the template's mtime on
+    each get_template, an edited invoice_template.html is picked up without a restart.
+    """
+    key = search_path, cache_path
+    with template_environments_lock:
+        template_env = template_environments.get(key)
+        if template_env is None:
+            import jinja2
+
+            if not os.path.exists(cache_path):
+                os.makedirs(cache_path)
+            template_env = jinja2.Environment(loader=jinja2.FileSystemLoader(search_path),
+                                              bytecode_cache=jinja2.FileSystemBytecodeCache(cache_path),
+                                              auto_reload=True)
+            template_environments[key] = template_env
+    return template_env
+
+
+def render_invoice_html(context, template_path):
+    return template_environment().get_template(template_path).render(records=context)
+
+
+def write_html_pdf(output_text, output_path, wkhtmltopdf=None):
+    import pdfkit
+
+    config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf)
+    pdfkit.from_string(output_text, output_path, configuration=config)
+    return output_path
+
+
+def render_invoice_pdf(context, output_path, template_path, wkhtmltopdf=None):
+    return write_html_pdf(render_invoice_html(context, template_path), output_path, wkhtmltopdf)
+
+
+def invoice_engine(name):
+    """Validates the 'invoice_engine' row of the Configs sheet, wkhtmltopdf when it is blank"""
+    engine = (name or 'wkhtmltopdf').strip().lower()
+    if engine not in INVOICE_ENGINES:
+        raise ValueError(f"Unknown invoice engine '{engine}', expected one of {', '.join(INVOICE_ENGINES)}")
+    return engine
+
+
+def configured_invoice_engine(name):
+    """invoice_engine for the Configs row, a typo falls back to wkhtmltopdf with a warning instead of raising"""
+    try:
+        return invoice_engine(name)
+    except ValueError as e:
+        print(f'{e}; using wkhtmltopdf')
+        return 'wkhtmltopdf'
+
+
+def render_invoice(context, output_path, engine='wkhtmltopdf', template_path=None, wkhtmltopdf=None,
+                   render_cache=None):
+    """Writes one invoice PDF with the html template through wkhtmltopdf, or drawn by ReportLab.
+
+    With a render_cache, a PDF rendered before from the same html (or, for ReportLab,
+    the same context) by the same engine version is copied instead. Returns True
+    when that happened.
+    """
+    if engine == 'reportlab':
+        import reportlab_invoice
+
+        content = json.dumps(context, sort_keys=True, default=str)
+        engine_version = reportlab_invoice.ENGINE_VERSION
+
+        def write_pdf():
+            reportlab_invoice.render_invoice_pdf(context, output_path)
+    else:
+        content = render_invoice_html(context, template_path)
+        engine_version = wkhtmltopdf_version(wkhtmltopdf) if render_cache is not None else None
+
+        def write_pdf():
+            write_html_pdf(content, output_path, wkhtmltopdf)
+
+    if render_cache is None:
+        write_pdf()
+        return False
+    key = render_cache.key(engine, engine_version, content)
+    if render_cache.fetch(key, output_path):
+        return True
+    write_pdf()
+    render_cache.store(key, output_path)
+    return False
+
+
+class RenderJob:
+    def __init__(self, bill_no, context, output_path):
+        self.bill_no = bill_no
+        self.context = context
+        self.output_path = output_path
+        self.attempts = 0
+        self.error = None
+
+
+class InvoiceRenderQueue:
+    """Renders invoice PDFs one after another on a worker thread.
+
+    The Tk thread submits a fully built context and carries on; finished and failed
+    jobs come back through poll(), which the app calls from root.after. A failing
+    render is retried up to max_attempts times with a growing pause, since the usual
+    cause is a PDF that is still open in a viewer or a busy wkhtmltopdf.
+    """
+
+    def __init__(self, template_path, wkhtmltopdf=None, engine='wkhtmltopdf', render_cache=None, max_attempts=3,
+                 retry_delay=1.0):
+        self.template_path = template_path
+        self.wkhtmltopdf = wkhtmltopdf
+        self.engine = engine
+        self.render_cache = render_cache
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+        self.worker = None
+
+    def submit(self, bill_no, context, output_path):
+        with self.pending_lock:
+            self.pending += 1
+        self.jobs.put(RenderJob(bill_no, context, output_path))
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+
+    def prewarm(self):
+        """Compiles the template (or loads ReportLab) on a background thread, so the first invoice does not pay for it"""
+        def compile_template():
+            try:
+                if self.engine == 'reportlab':
+                    import reportlab_invoice  # noqa: F401
+                else:
+                    template_environment().get_template(self.template_path)
+            except Exception:
+                pass  # The first real render reports the problem
+
+        threading.Thread(target=compile_template, daemon=True).start()
+
+    def depth(self):
+        """Invoices submitted and not yet finished, including the one being rendered"""
+        with self.pending_lock:
+            return self.pending
+
+    def run(self):
+        # No Tk calls in here, results go back through self.results
+        while True:
+            job = self.jobs.get()
+            while True:
+                job.attempts += 1
+                try:
+                    render_invoice(job.context, job.output_path, self.engine, self.template_path, self.wkhtmltopdf,
+                                   self.render_cache)
+                    job.error = None
+                    break
+                except Exception as e:
+                    job.error = e
+                    if job.attempts >= self.max_attempts:
+                        break
+                    time.sleep(self.retry_delay * job.attempts)
+            with self.pending_lock:
+                self.pending -= 1
+            self.results.put(job)
+
+    def poll(self):
+        """Returns the jobs finished since the last call, succeeded or failed"""
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def wait(self, timeout=None):
+        """Blocks until every submitted invoice is rendered, used when the window closes"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.depth():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
@@ -1,43 +1,36 @@
+import time
+
+STARTUP_STARTED = time.perf_counter()  # Taken before the other imports so --profile-startup can time them
+
+import argparse
 import datetime
-import json
-import math
 import os
+import queue
+import threading
 import tkinter as tk
-from tkinter import ttk, PhotoImage, Text, messagebox, scrolledtext
-
-import jinja2
-import pandas as pd
-import pdfkit
-import requests
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from tkinter import ttk, PhotoImage, Text, filedialog, messagebox, scrolledtext
+
 from tkcalendar import DateEntry
 
+from amount_words import amount_in_words
+from bill_number_allocator import BillNumberAllocator
+from invoice_render import InvoiceRenderQueue, build_invoice_context, configured_invoice_engine, invoice_file_name
+from invoice_storage import open_invoice_store
+from ledger_export import export_ledger
+from line_items import LineItemStore, line_row
+from render_cache import RenderCache
+from sales_analytics import SalesRollups
+from master_data import ConfigService, MasterDataSnapshot
+from price_catalog import PriceCatalog
+from pricing import LineItem, bill_total, hourly_cost, line_total, rate_amount
+from searchable_combobox import SearchableCombobox
+from startup_profile import StartupProfiler
+from treeview_model import TreeviewModel
 
-def number_to_words(number):
-    number = int(number)
-    ones = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine"]
-    teens = ["", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen", "Seventeen", "Eighteen", "Nineteen"]
-    tens = ["", "Ten", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
-
-    if 0 <= number < 10:
-        return ones[number]
-    elif 10 <= number < 20:
-        return teens[number - 10]
-    elif 20 <= number < 100:
-        return tens[number // 10] + (" " + ones[number % 10] if number % 10 > 0 else "")
-    elif 100 <= number < 1000:
-        return ones[number // 100] + " Hundred" + (" and " + number_to_words(number % 100) if number % 100 > 0 else "")
-    elif 1000 <= number < 1000000:
-        return number_to_words(number // 1000) + " Thousand" + (
-            " " + number_to_words(number % 1000) if number % 1000 > 0 else "")
-    elif 1000000 <= number < 1000000000:
-        return number_to_words(number // 1000000) + " Million" + (
-            " " + number_to_words(number % 1000000) if number % 1000000 > 0 else "")
-    else:
-        return "Number out of range"
+# pandas, jinja2, pdfkit and reportlab are imported inside the methods that use them, they are
+# only needed once an invoice or a bill report is produced and cost most of the start up time.
+
+IMPORTS_FINISHED = time.perf_counter()
 
 
 # class TreeViewEdit(ttk.Treeview):
@@ -150,23 +143,12 @@ class RecordEditorPopup:
     def save_record(self):
         updated_record = [var.get() for var in self.entry_vars]
         tuple_datas = []
-        tuple_sum = 0
         for child_item_id in self.popUpTreeview.get_children():
-            values = self.popUpTreeview.item(child_item_id, 'values')
-            try:
-                tuple_sum += int(values[2])
-            except:
-                pass
-            tuple_datas.append(values)
+            tuple_datas.append(self.popUpTreeview.item(child_item_id, 'values'))
         updated_record[-1] = tuple_datas
-        print(updated_record)
-
-        sum_value = 0
-        for n, value in enumerate(updated_record[5:-1], start=5):
-            if n in [6, 8]:
-                continue
-            sum_value += int(value)
-        updated_record[3] = sum_value + tuple_sum
+
+        # The entries hold text, so the edited costs are summed with int like before
+        updated_record[3] = LineItem.from_values(updated_record).piece_cost(int)
         self.popup.destroy()
         if self.popup_closed_callback:
             self.popup_closed_callback(updated_record)
@@ -177,6 +159,168 @@ class RecordEditorPopup:
             self.popup_closed_callback(None)
 
 
+class LedgerExportDialog:
+    """Filters for the consolidated ledger, the export itself runs on a worker thread"""
+
+    def __init__(self, master, open_store, client_names, financial_year, details_path):
+        self.master = master
+        self.open_store = open_store
+        self.details_path = details_path
+        self.export_results = queue.Queue()
+
+        self.popup = tk.Toplevel(master)
+        self.popup.title("Export Ledger")
+
+        self.financial_year_var = tk.StringVar(value=financial_year)
+        self.client_var = tk.StringVar(value='')
+        self.date_from_var = tk.StringVar(value='')
+        self.date_to_var = tk.StringVar(value='')
+        self.status_var = tk.StringVar(value='Leave a field blank to include everything')
+
+        fields = [
+            ("Financial Year (yy-yy):", ttk.Entry(self.popup, textvariable=self.financial_year_var)),
+            ("Client:", ttk.Combobox(self.popup, textvariable=self.client_var, values=[''] + list(client_names))),
+            ("From (YYYY-MM-DD):", ttk.Entry(self.popup, textvariable=self.date_from_var)),
+            ("To (YYYY-MM-DD):", ttk.Entry(self.popup, textvariable=self.date_to_var)),
+        ]
+        for row_number, (label_text, widget) in enumerate(fields):
+            label = tk.Label(self.popup, text=label_text, anchor="w", justify="left")
+            label.grid(row=row_number, column=0, padx=3, pady=3, sticky="e")
+            label.config(font=("times new roman", 12))
+            widget.grid(row=row_number, column=1, padx=3, pady=3, sticky="w")
+
+        self.export_button = tk.Button(self.popup, text="Export", command=self.export)
+        self.export_button.grid(row=len(fields), column=0, columnspan=2, padx=3, pady=3)
+        self.export_button.config(font=("times new roman", 12))
+        status_label = tk.Label(self.popup, textvariable=self.status_var)
+        status_label.grid(row=len(fields) + 1, column=0, columnspan=2, padx=3, pady=3)
+
+    def export(self):
+        financial_year = self.financial_year_var.get().strip()
+        output_path = filedialog.asksaveasfilename(
+            parent=self.popup, initialdir=self.details_path, defaultextension='.xlsx',
+            initialfile=f"Ledger_{financial_year or 'All'}.xlsx",
+            filetypes=[("Excel workbook", "*.xlsx"), ("CSV file", "*.csv")])
+        if not output_path:
+            return
+
+        filters = {
+            'financial_years': [financial_year] if financial_year else None,
+            'client_name': self.client_var.get().strip() or None,
+            'date_from': self.date_from_var.get().strip() or None,
+            'date_to': self.date_to_var.get().strip() or None,
+        }
+        self.export_button.config(state='disabled')
+        self.status_var.set("Exporting...")
+        threading.Thread(target=self.export_worker, args=(output_path, filters), daemon=True).start()
+        self.popup.after(100, self.poll_export)
+
+    def export_worker(self, output_path, filters):
+        # No Tk calls in here, the result is handed back to the Tk thread through the queue
+        try:
+            # A store of its own, sqlite connections cannot be shared with the Tk thread
+            invoice_store = self.open_store()
+            self.export_results.put((output_path, export_ledger(invoice_store, output_path, **filters), None))
+        except Exception as e:
+            self.export_results.put((output_path, 0, e))
+
+    def poll_export(self):
+        try:
+            output_path, count, error = self.export_results.get_nowait()
+        except queue.Empty:
+            self.popup.after(100, self.poll_export)
+            return
+
+        self.export_button.config(state='normal')
+        if error is not None:
+            self.status_var.set("")
+            messagebox.showerror("Export Failed", f"Could not export the ledger: {error}", parent=self.popup)
+            return
+        self.status_var.set(f"{count} line items written to {os.path.basename(output_path)}")
+
+
+class SalesDashboard:
+    """Revenue and hours by client, dress pattern, layer and month, read from the sales rollups"""
+
+    TABS = [('client', "Client"), ('dress_pattern', "Dress Pattern"), ('layer', "Layer"), ('month', "Month")]
+    COLUMNS = ["Bills", "Lines", "Revenue", "Machine Hrs", "Embroidery Hrs"]
+
+    def __init__(self, master, open_store, database_path, financial_year):
+        self.open_store = open_store
+        self.database_path = database_path
+        self.load_results = queue.Queue()
+        self.rollups = None
+
+        self.popup = tk.Toplevel(master)
+        self.popup.title("Sales Dashboard")
+
+        self.financial_year_var = tk.StringVar(value=financial_year)
+        self.status_var = tk.StringVar(value="Loading...")
+        label = tk.Label(self.popup, text="Financial Year (yy-yy, blank for all):", anchor="w", justify="left")
+        label.grid(row=0, column=0, padx=3, pady=3, sticky="e")
+        label.config(font=("times new roman", 12))
+        year_entry = ttk.Entry(self.popup, textvariable=self.financial_year_var)
+        year_entry.grid(row=0, column=1, padx=3, pady=3, sticky="w")
+        year_entry.bind("<Return>", lambda event: self.show_rollups())
+        show_button = tk.Button(self.popup, text="Show", command=self.show_rollups)
+        show_button.grid(row=0, column=2, padx=3, pady=3)
+        show_button.config(font=("times new roman", 12))
+
+        notebook = ttk.Notebook(self.popup)
+        notebook.grid(row=1, column=0, columnspan=3, padx=3, pady=3, sticky='nsew')
+        self.tab_rows = {}
+        for dimension, title in self.TABS:
+            tree = ttk.Treeview(notebook, columns=[title] + self.COLUMNS, show='headings')
+            for column_name in [title] + self.COLUMNS:
+                tree.heading(column_name, text=column_name)
+                tree.column(column_name, width=160 if column_name == title else 90,
+                            anchor='w' if column_name == title else 'e')
+            notebook.add(tree, text=title)
+            self.tab_rows[dimension] = TreeviewModel(tree)
+        status_label = tk.Label(self.popup, textvariable=self.status_var, anchor="w", justify="left")
+        status_label.grid(row=2, column=0, columnspan=3, padx=3, pady=3, sticky="w")
+
+        threading.Thread(target=self.load_worker, daemon=True).start()
+        self.popup.after(50, self.poll_load)
+
+    def load_worker(self):
+        # Normally only reads the yearly sidecars, bills they have not seen yet are folded in from the store first
+        try:
+            self.load_results.put((SalesRollups(self.database_path).refresh(self.open_store()), None))
+        except Exception as e:
+            self.load_results.put((None, e))
+
+    def poll_load(self):
+        try:
+            self.rollups, error = self.load_results.get_nowait()
+        except queue.Empty:
+            self.popup.after(50, self.poll_load)
+            return
+        if error is not None:
+            self.status_var.set("")
+            messagebox.showerror("Sales Dashboard", f"Could not read the sales rollups: {error}", parent=self.popup)
+            return
+        self.show_rollups()
+
+    @staticmethod
+    def measure_values(measures):
+        return [measures['bills'], measures['lines'], measures['revenue'],
+                f"{measures['machine_hours']:.1f}", f"{measures['embroidery_hours']:.1f}"]
+
+    def show_rollups(self):
+        if self.rollups is None:
+            return
+        financial_year = self.financial_year_var.get().strip()
+        financial_years = [financial_year] if financial_year else None
+        for dimension, rows in self.tab_rows.items():
+            # '' is the Treeview's root, so blank keys need an iid of their own
+            rows.set_rows((f'{dimension}:{key}', [key or '-'] + self.measure_values(measures))
+                          for key, measures in self.rollups.report(dimension, financial_years))
+        totals = self.rollups.totals(financial_years)
+        self.status_var.set(f"{totals['bills']} bills, revenue {totals['revenue']}, machine "
+                            f"{totals['machine_hours']:.1f} hrs, embroidery {totals['embroidery_hours']:.1f} hrs")
+
+
 class PurchaseInterface:
     def __init__(self):
         self.root = tk.Tk()
@@ -263,7 +407,8 @@ class PurchaseInterface:
 
 
 class BillInformationApp:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None):
+        self.profiler = profiler
         self.check_expiration_date()
         self.root = root
         self.current_app = None
@@ -275,15 +420,31 @@ class BillInformationApp:
         self.INPUT_IMAGES_PATH = 'Input Pics'
         self.DATABASE_PATH = 'Database'
         self.database_file = 'Invoice_Datas.json'
-        self.excel_file = pd.ExcelFile(f"{self.INPUT_FILES_PATH}/User_Input_datas.xlsx")
-        self.data_df = pd.read_excel(self.excel_file, 'Data & Assumption')
-        self.stock_df = pd.read_excel(self.excel_file, 'Stock Statement')
-        self.client_df = pd.read_excel(self.excel_file, 'Client Details')
-        self.excel_file.close()
-        self.pattern_price_hash_data = {}
-        self.layer_price_hash_data = {}
-        self.source_data_list = []
-        self.accessory_data_dict = {}
+        self.master_data_snapshot = MasterDataSnapshot(f"{self.INPUT_FILES_PATH}/User_Input_datas.xlsx",
+                                                       os.path.join(self.DATABASE_PATH, 'Master_Data_Snapshot.json'))
+        self.config_service = ConfigService(self.master_data_snapshot).load()
+        self.master_data = self.config_service.master_data
+        self.refresh_thread = None
+        self.refresh_results = queue.Queue()
+        self.mark_startup('workbook load')
+        self.invoice_store = open_invoice_store(self.DATABASE_PATH, self.get_config_value('storage_engine', 'journal'),
+                                                legacy_file=self.database_file,
+                                                current_financial_year=self.get_financial_year())
+        self.bill_number_allocator = BillNumberAllocator(
+            self.invoice_store, sales_rollups=SalesRollups(self.DATABASE_PATH))
+        self.price_catalog = PriceCatalog()
+        engine = configured_invoice_engine(self.get_config_value('invoice_engine'))  # Never stops the start up
+        self.invoice_render_queue = InvoiceRenderQueue(f"{self.INPUT_FILES_PATH}/invoice_template.html",
+                                                       self.get_config_value('whtmltopdf'), engine,
+                                                       self.open_render_cache())
+        self.invoice_render_queue.prewarm()
+        self.render_polling = False
+        self.last_rendered_bill = None
+        self.line_items = LineItemStore()
+        self.editing_line_id = None
+        self.bill_total_cost = 0  # Kept up to date as lines are added, edited and deleted
+        self.displayed_total_cost = None
+        self.total_refresh_pending = False
         # self.invoice_data_fields = ['bill_no', 'bill_date', 'client_name', 'dress_pattern', 'piece_name', 'layer_name',
         #                             'layer_qnty', 'layer_price', 'machine_cost', 'embroidery_cost', 'dying_charges',
         #                             'other_cost', 'fixed_cost', 'accessory_name', 'accessory_qnty', 'accessory_price']
@@ -294,8 +455,8 @@ class BillInformationApp:
         self.bill_no_integer = 1
         self.check_for_database_availability()
 
-        self.update_layer_prices_hash_map(self.stock_df)
-        self.update_piece_prices_hash_map(self.data_df)
+        self.price_catalog.update_from_master_data(self.master_data)
+        self.mark_startup('invoice database open')
 
         root.title("Malar Vikram")
         self.root.iconbitmap(f'{self.INPUT_IMAGES_PATH}/logo_.ico')
@@ -338,27 +499,69 @@ class BillInformationApp:
 
         # self.create_watermark()
 
-        self.machine_cost_var.trace("w", self.recalculate_total_cost)
-        self.embroidery_cost_var.trace("w", self.recalculate_total_cost)
-        self.embroidery_material_cost_var.trace("w", self.recalculate_total_cost)
-        self.fixed_cost_var.trace("w", self.recalculate_total_cost)
-        self.other_cost_var.trace("w", self.recalculate_total_cost)
-        self.dying_var.trace("w", self.recalculate_total_cost)
+        # Coalesced, a burst of keystrokes in the cost fields refreshes the total once when Tk is idle
+        self.machine_cost_var.trace("w", self.schedule_total_refresh)
+        self.embroidery_cost_var.trace("w", self.schedule_total_refresh)
+        self.embroidery_material_cost_var.trace("w", self.schedule_total_refresh)
+        self.fixed_cost_var.trace("w", self.schedule_total_refresh)
+        self.other_cost_var.trace("w", self.schedule_total_refresh)
+        self.dying_var.trace("w", self.schedule_total_refresh)
         # self.total_layer_cost_var.trace("w", self.recalculate_total_cost)
         # self.total_accessory_cost_var.trace("w", self.recalculate_total_cost)
+        self.mark_startup('widget construction')
+
+    def mark_startup(self, phase):
+        if self.profiler is not None:
+            self.profiler.mark(phase)
+
+    def report_startup_profile(self):
+        self.root.update_idletasks()
+        self.mark_startup('first window drawn')
+        print(self.profiler.report())
+        self.root.after(0, self.root.destroy)
 
     def load_excel_datas(self):
-        self.excel_file = pd.ExcelFile(f"{self.INPUT_FILES_PATH}/User_Input_datas.xlsx")
-        self.data_df = pd.read_excel(self.excel_file, 'Data & Assumption')
-        self.stock_df = pd.read_excel(self.excel_file, 'Stock Statement')
-        self.client_df = pd.read_excel(self.excel_file, 'Client Details')
-        self.excel_file.close()
-        self.update_piece_prices_hash_map(self.data_df)
-        self.update_layer_prices_hash_map(self.stock_df)
+        """Reads the workbook on a worker thread, the window keeps responding while pandas parses it"""
+        if self.refresh_thread is not None and self.refresh_thread.is_alive():
+            return
+        self.refresh_button.config(state='disabled')
+        self.refresh_thread = threading.Thread(target=self.load_master_data_worker, daemon=True)
+        self.refresh_thread.start()
+        self.root.after(100, self.poll_master_data_refresh)
+
+    def load_master_data_worker(self):
+        # No Tk calls in here, the result is handed back to the Tk thread through the queue
+        try:
+            self.refresh_results.put((self.master_data_snapshot.load_with_key(), None))
+        except Exception as e:
+            self.refresh_results.put((None, e))
+
+    def poll_master_data_refresh(self):
+        try:
+            loaded, error = self.refresh_results.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_master_data_refresh)
+            return
+
+        self.refresh_button.config(state='normal')
+        if error is not None:
+            messagebox.showerror("Refresh Failed", f"Could not read the input workbook: {error}")
+            return
+        self.apply_master_data(*loaded)
+
+    def apply_master_data(self, master_data, workbook_key):
+        # Runs on the Tk thread, so price maps and dropdowns are swapped together between two events
+        self.config_service.set_master_data(master_data, workbook_key)
+        self.master_data = master_data
+        self.price_catalog.update_from_master_data(self.master_data)
         self.reload_layer_dropdown()
         self.reload_dress_pattern_dropdown()
         self.reload_client_names_dropdown()
         self.reload_accessory_dropdown()
+        self.invoice_render_queue.engine = configured_invoice_engine(self.get_config_value('invoice_engine'))
+
+    def get_config_value(self, config_type, default=None):
+        return self.config_service.config_value(config_type, default)
 
     @staticmethod
     def get_financial_year():
@@ -379,10 +582,12 @@ class BillInformationApp:
         self.bill_entry.config(state='disabled')
 
     def show_preview_bill_v1(self):
+        import pandas as pd
+
         text_widget = scrolledtext.ScrolledText(wrap=tk.WORD, font=("Courier", 10))
         text_widget.grid(row=8, column=7, columnspan=2, padx=3, pady=3)
 
-        df = pd.DataFrame(self.source_data_list)
+        df = pd.DataFrame(self.line_items.records())
         result_df = df.groupby('dress_pattern')['total_cost'].sum().reset_index()
         total_age = df['total_cost'].sum()
 
@@ -392,53 +597,26 @@ class BillInformationApp:
         # Insert the formatted string and age total into the text widget
         text_widget.insert(tk.END, f"{df_string}\n\nTotal Age: {total_age}")
 
-    def save_json(self, json_data):
-        """Saves json data of page. Takes 2 arguments json data and file name without extension"""
-        html_path = os.path.join(os.getcwd(), self.DATABASE_PATH)  # html folder path
-        if not os.path.exists(html_path):
-            os.makedirs(html_path)
-        json_file_name = os.path.join(html_path, self.database_file)
-        json_obj = json.dumps(json_data, indent=3)
-        with open(f'{json_file_name}', "w", encoding='utf-8') as file:
-            file.write(json_obj)
-
     def open_json_file(self):
-        '''Opens a html file and read it to return the soup of that page'''
-        if os.path.exists(f"{self.DATABASE_PATH}/{self.database_file}"):
-            with open(f"{self.DATABASE_PATH}/{self.database_file}", 'r') as f:  # Folder name should be Json in the cwd
-                data = f.read()
-                json_data = json.loads(data)
-                return json_data
-        return {}
+        """Returns the saved bills in the old {'results': [...], '{fy}_last_bill_no': n} structure"""
+        return self.invoice_store.load()
 
-    def check_for_database_availability(self):
-        if os.path.exists(f"{self.DATABASE_PATH}/{self.database_file}"):
-            database_datas = self.open_json_file()
-            financial_year = self.get_financial_year()
-            last_bill_no = database_datas.get(f'{financial_year}_last_bill_no', 0)
-            self.bill_no_integer = int(last_bill_no) + 1
-        else:
-            self.bill_no_integer = 1
+    def get_invoice(self, bill_no):
+        """Returns {'bill_no', 'client_name', 'bill_date', 'records'} of a saved bill, or None"""
+        return self.invoice_store.get_invoice(bill_no)
 
-    def save_datas_to_database(self):
+    def check_for_database_availability(self):
         financial_year = self.get_financial_year()
-        last_num_key = f'{financial_year}_last_bill_no'
-
-        if os.path.exists(f"{self.DATABASE_PATH}/{self.database_file}"):
-            database_datas = self.open_json_file()
-            current_data = {self.bill_entry.get(): self.source_data_list}
-            database_datas['results'].append(current_data)
-            database_datas[last_num_key] = self.bill_label.get().split('/')[-1]
-            self.save_json(database_datas)
-        else:
-            result_datas = {
-                'results': [{self.bill_entry.get(): self.source_data_list}],
-                last_num_key: self.bill_label.get().split('/')[-1]
-            }
-            self.save_json(result_datas)
+        self.bill_no_integer = self.bill_number_allocator.peek_next_bill_no(financial_year)
 
-        self.bill_no_integer += 1
+    def save_datas_to_database(self, records, client_name, bill_date):
+        # The number on screen is only a preview, the real one is reserved under the database lock
+        bill_no = self.bill_number_allocator.save_invoice(self.get_financial_year(), records,
+                                                          client_name=client_name, bill_date=bill_date.isoformat())
+
+        self.bill_no_integer = self.bill_number_allocator.bill_number(bill_no) + 1
         self.generate_bill_no()
+        return bill_no
 
     def clear_datas(self):
         self.piece_var.set('')
@@ -454,165 +632,100 @@ class BillInformationApp:
         self.accessory_price_var.set(0)
         self.accessory_quantity_var.set(0)
 
-        self.clear_treeview(self.treeview)
+        self.line_rows.clear()
+        self.accessory_rows.clear()
+        self.line_items.clear()
+        self.bill_total_cost = 0
+        self.displayed_total_cost = 0
         self.total_cost_var.set(0)
         self.total_cost_in_word.delete("1.0", tk.END)
 
-    def create_invoice_pdf(self):
-        self.save_datas_to_database()
+    def commit_choice(self, combobox, label):
+        """Settles half typed text in a search box before a handler reads its variable"""
+        if combobox.commit():
+            return True
+        messagebox.showwarning("Unknown Value", f"Choose a {label} from the list.", parent=self.root)
+        return False
 
-        # self.show_preview_bill()
-        company_details = pd.read_excel(f'{self.INPUT_FILES_PATH}/User_Input_datas.xlsx', 'Company Details')
-        company_details.fillna('', inplace=True)
+    def create_invoice_pdf(self):
+        if not self.commit_choice(self.client_name_combobox, "client"):
+            return
+        # One reading of the form for both the save and the invoice, the master data reload below may reset it
+        records = self.line_items.records()
         client_name = self.client_name_var.get()
-
-        client_details = self.client_df[self.client_df['Client Names'] == client_name]
-        client_details.fillna('', inplace=True)
-
-        client_data_dict = {}
-        for data in client_details.iterrows():
-            client_data_dict = data[1].to_dict()
-
-        company_data_dict = {}
-        for data in company_details.iterrows():
-            company_data_dict = data[1].to_dict()
-
-        price_variable = self.total_cost_var.get()
-        tax_value = round(price_variable * 0.05, 2)
-        total_value = price_variable + tax_value
-
-        bill_no = self.bill_label.get()
         bill_date = self.calendar.get_date()
-        formatted_date = bill_date.strftime("%d-%m-%Y")
-        df = pd.DataFrame(self.source_data_list)
-        result_df = df.groupby('dress_pattern')['total_cost'].sum().reset_index()
-
-        dress_data_list = []
-        for s_no, record in enumerate(result_df.iterrows(), start=1):
-            data_dict = {'s_no': s_no}
-            data_dict = {**data_dict, **record[1].to_dict()}
-            dress_data_list.append(data_dict)
-
-        customer_details = {
-            'company_name': company_data_dict['Name'],
-            'address_line_1': company_data_dict['Address_Line_1'],
-            'address_line_2': company_data_dict['Address_Line_2'],
-            'gstn_no': company_data_dict['GSTN'],
-            'name': client_name,
-            'bill_no': bill_no,
-            'bill_date': formatted_date,
-            'state': client_data_dict['State'],
-            'email_id': client_data_dict['Email'],
-            'phone_number': client_data_dict['Phone Number'],
-            'dress_records': dress_data_list,
-            'other_charges': tax_value,
-            'amount_receivable': total_value,
-            'invoice_value': total_value,
-            'total_cost_for_client': price_variable,
-        }
-
-        template_loader = jinja2.FileSystemLoader('./')
-        template_env = jinja2.Environment(loader=template_loader)
-
-        template = template_env.get_template(f"{self.INPUT_FILES_PATH}/invoice_template.html")
-
-        output_text = template.render(records=customer_details)
-
-        config_df = pd.read_excel(f'{self.INPUT_FILES_PATH}/User_Input_datas.xlsx', 'Configs')
-
-        type = 'whtmltopdf'
-        value = config_df[config_df['type'] == type]
-
-        config = pdfkit.configuration(wkhtmltopdf=value['value'].values[0])
-
-        # Use output_text instead of html_text in the following line
-        invoice_file_name = f"{self.INVOICE_PATH}/{bill_no.replace('/', '_')}_{client_name}.pdf"
-        pdfkit.from_string(output_text, invoice_file_name, configuration=config)
+        self.recalculate_total_cost()
+        taxable_value = self.bill_total_cost
+        bill_no = self.save_datas_to_database(records, client_name, bill_date)
 
-        messagebox.showinfo("Invoice Generated", "Invoice generated successfully!")
+        # The bill is saved: from here on a failure must still clear the form, or Generate would save it twice
+        try:
+            # self.show_preview_bill()
+            if self.config_service.refresh_if_changed():
+                self.apply_master_data(self.config_service.master_data, self.config_service.workbook_key)
+
+            # The context is built now, the form is cleared before the PDF exists
+            customer_details = build_invoice_context(bill_no, records, client_name, bill_date,
+                                                     self.config_service.client_details(client_name),
+                                                     self.config_service.company_profile,
+                                                     taxable_value=taxable_value)
+
+            self.invoice_render_queue.wkhtmltopdf = self.get_config_value('whtmltopdf')
+            self.invoice_render_queue.submit(bill_no, customer_details,
+                                             invoice_file_name(self.INVOICE_PATH, bill_no, client_name))
+        except Exception as e:
+            messagebox.showerror("Invoice Failed", f"{bill_no} is saved but its invoice could not be made: {e}\n"
+                                                   f"Reprint it with batch_render.py --bill {bill_no}")
         self.clear_datas()
+        self.update_render_status()
+        if not self.render_polling:
+            self.render_polling = True
+            self.root.after(200, self.poll_invoice_renders)
 
-
-    def create_invoice_pdf_v1(self):
-        customer_details = {
-            "Name": self.client_name_var.get(),
-            "Bill No.": self.bill_label.get(),
-            "Bill Date": self.calendar.get_date(),
-            "State": "33-Tamil Nadu",
-            "GSTN": ""
-        }
-        price_variable = self.total_cost_var.get()
-        tax_value = round(price_variable * 0.05, 2)
-        total_value = price_variable + tax_value
-
-        invoice_items = [
-            ["S. No.", "Particulars", "Amount"],
-            [1, self.pattern_var.get(), price_variable]
-        ]
-
-        tax_details = [
-            ["Taxable Value", price_variable],
-            # ["CGST @ 2.50%", "169.56"],
-            # ["SGST @ 2.50%", "169.56"],
-            ["IGST @ 5.00%", tax_value],
-            ["Invoice Value", total_value],
-            ["Amount Receivable", math.floor(total_value)]
-        ]
-
-        # Create a PDF document
-        doc = SimpleDocTemplate("invoice.pdf", pagesize=letter)
-        elements = []
-
-        # Create a title
-        styles = getSampleStyleSheet()
-        title = "Tax Invoice"
-        elements.append(Paragraph(title, styles["Title"]))
-        elements.append(Paragraph("", styles["Normal"]))  # Add some space
-
-        # Create customer details
-        for key, value in customer_details.items():
-            elements.append(Paragraph(f"<b>{key}:</b> {value}", styles["Normal"]))
-        elements.append(Paragraph("<br/><br/>", styles["Normal"]))  # Add some space
-
-        # Create a table for invoice items
-        data = invoice_items
-        t = Table(data, colWidths=[30, 270, 100])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(Paragraph("Invoice Details:", styles["Heading2"]))  # Add a heading
-        elements.append(t)
-        elements.append(Paragraph("<br/><br/>", styles["Normal"]))  # Add some space
-
-        # Create a table for tax details
-        data = tax_details
-        t = Table(data, colWidths=[300, 100])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(Paragraph("Tax Details:", styles["Heading2"]))  # Add a heading
-        elements.append(t)
-        elements.append(Spacer(1, 10))  # Add some space
-        elements.append(Paragraph("<br/><br/>", styles["Normal"]))  # Add some space
-
-        centered_style = styles['Normal']
-
-        elements.append(Paragraph("Thanks for the Order !!!", centered_style))
-        # Render the PDF
-        doc.build(elements)
-        messagebox.showinfo("Invoice Generated", "Invoice generated successfully!")
+    def open_render_cache(self):
+        """Reprinted invoices come from here, sized by the 'render_cache_mb' and 'render_cache_days' Configs rows"""
+        try:
+            max_megabytes = float(self.get_config_value('render_cache_mb', 200))
+            max_age_days = float(self.get_config_value('render_cache_days', 30))
+        except (TypeError, ValueError):
+            max_megabytes, max_age_days = 200, 30
+        return RenderCache(os.path.join(self.DATABASE_PATH, 'Render_Cache'), int(max_megabytes * 1024 * 1024),
+                           max_age_days)
+
+    def poll_invoice_renders(self):
+        for job in self.invoice_render_queue.poll():
+            if job.error is not None:
+                messagebox.showerror("Invoice Failed",
+                                     f"Bill {job.bill_no} is saved, but its PDF could not be generated after "
+                                     f"{job.attempts} attempts: {job.error}")
+            else:
+                self.last_rendered_bill = job.bill_no
+        self.update_render_status()
+        if self.invoice_render_queue.depth():
+            self.root.after(200, self.poll_invoice_renders)
+        else:
+            self.render_polling = False
+
+    def update_render_status(self):
+        depth = self.invoice_render_queue.depth()
+        if depth:
+            self.render_status_var.set(f"Generating {depth} invoice{'s' if depth > 1 else ''}...")
+        elif self.last_rendered_bill:
+            self.render_status_var.set(f"Invoice {self.last_rendered_bill} generated")
+        else:
+            self.render_status_var.set("")
+
+    def on_close(self):
+        depth = self.invoice_render_queue.depth()
+        if depth and not messagebox.askyesno("Invoices Pending",
+                                             f"{depth} invoice PDF(s) are still being generated. "
+                                             f"Wait for them before closing?"):
+            self.root.destroy()
+            return
+        self.render_status_var.set("Finishing invoices...")
+        self.root.update_idletasks()
+        self.invoice_render_queue.wait(timeout=60)
+        self.root.destroy()
 
     def show_purchase_interface(self):
         purchase_app = PurchaseInterface()
@@ -627,48 +740,43 @@ class BillInformationApp:
         # file_menu.add_command(label="Open Purchase Entry", command=self.show_purchase_interface)
         # file_menu.add_command(label="Open Application 2", command=self.show_application2)
         # file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
-
-    def save_client_details_to_json(self):
-        df = pd.DataFrame(self.source_data_list)
-
-        # Extracting the length of the DataFrame
-        length_of_df = len(df)
-
-        # Creating df1 DataFrame
-        df1 = pd.DataFrame({
-            'bill_no': [self.bill_label.get()] * length_of_df,
-            'client_name': [self.client_name_var.get()] * length_of_df,
-            'bill_date': [self.calendar.get_date()] * length_of_df
-        })
+        file_menu.add_command(label="Export Ledger...", command=self.open_ledger_export)
+        file_menu.add_command(label="Sales Dashboard...", command=self.open_sales_dashboard)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.on_close)
 
-        # Concatenating df1 and df horizontally
-        concat_df = pd.concat([df1, df], axis=1)
+    def open_ledger_export(self):
+        LedgerExportDialog(self.root, self.open_store_for_worker, self.client_names, self.get_financial_year(),
+                           self.DETAILS_PATH)
 
-        # Extracting bill_no and client_name for the file name
-        bill_no = str(self.bill_label.get())
-        client_name = str(self.client_name_var.get())
+    def open_sales_dashboard(self):
+        SalesDashboard(self.root, self.open_store_for_worker, self.DATABASE_PATH, self.get_financial_year())
 
-        details_file_name = f"{self.DETAILS_PATH}/{bill_no.replace('/', '_')}_{client_name}.xlsx"
-
-        concat_df.to_excel(details_file_name, index=False)
-        messagebox.showinfo("Bill Details Generated", "Bill generated successfully!")
+    def open_store_for_worker(self):
+        return open_invoice_store(self.DATABASE_PATH, self.get_config_value('storage_engine', 'journal'),
+                                  legacy_file=self.database_file, current_financial_year=self.get_financial_year())
 
     def generate_save_details(self):
-        add_layer_button = tk.Button(self.root, text="Save Details", command=self.save_client_details_to_json)
+        add_layer_button = tk.Button(self.root, text="Export Ledger", command=self.open_ledger_export)
         add_layer_button.grid(row=1, column=6, columnspan=2, padx=3, pady=3)
         add_layer_button.config(font=("times new roman", 12))
 
     def refresh_datas(self):
-        refresh_button = tk.Button(self.root, text="Refresh", command=self.load_excel_datas)
-        refresh_button.grid(row=2, column=6, columnspan=2, padx=3, pady=3)
-        refresh_button.config(font=("times new roman", 12))
+        self.refresh_button = tk.Button(self.root, text="Refresh", command=self.load_excel_datas)
+        self.refresh_button.grid(row=2, column=6, columnspan=2, padx=3, pady=3)
+        self.refresh_button.config(font=("times new roman", 12))
 
     def generate_in_voice_button(self):
         add_layer_button = tk.Button(self.root, text="Generate Invoice", command=self.create_invoice_pdf)
         add_layer_button.grid(row=0, column=6, columnspan=2, padx=3, pady=3)
         add_layer_button.config(font=("times new roman", 12))
 
+        # Shows how many invoices the render queue still has to produce
+        self.render_status_var = tk.StringVar()
+        render_status_label = tk.Label(self.root, textvariable=self.render_status_var, anchor="w", justify="left")
+        render_status_label.grid(row=3, column=6, columnspan=2, padx=3, pady=3)
+        render_status_label.config(font=("times new roman", 10))
+
     def create_bill_info_section(self):
         self.create_label_and_entry("Bill No:")
         self.create_date_entry("Bill Date:")
@@ -708,7 +816,26 @@ class BillInformationApp:
         except Exception as e:
             print("Error:", e)
 
+    def add_to_total_cost(self, amount):
+        self.bill_total_cost += amount
+        self.schedule_total_refresh()
+
+    def schedule_total_refresh(self, *args):
+        if not self.total_refresh_pending:
+            self.total_refresh_pending = True
+            self.root.after_idle(self.refresh_total_cost)
+
+    def refresh_total_cost(self):
+        self.total_refresh_pending = False
+        if self.bill_total_cost == self.displayed_total_cost:
+            return
+        self.displayed_total_cost = self.bill_total_cost
+        self.total_cost_var.set(self.bill_total_cost)
+        self.total_cost_in_word.delete("1.0", tk.END)  # Clear existing text
+        self.total_cost_in_word.insert(tk.END, amount_in_words(self.bill_total_cost))
+
     def recalculate_total_cost(self, *args):
+        """Full recount of the running total before an invoice, so drift from the running sums is never printed"""
         # Calculate the total cost by summing up all individual costs
         # total_cost = sum([
         #     self.machine_cost_var.get() if isinstance(self.machine_cost_var.get(), int) else 0,
@@ -720,18 +847,8 @@ class BillInformationApp:
         #     self.total_layer_cost_var.get() if isinstance(self.dying_var.get(), int) else 0,
         #     self.total_accessory_cost_var.get() if isinstance(self.total_accessory_cost_var.get(), int) else 0,
         # ])
-        total_cost = 0
-        for record in self.source_data_list:
-            try:
-                total_cost += int(record['total_cost'])
-            except:
-                continue
-
-        # Update the total cost variable
-        self.total_cost_var.set(total_cost)
-
-        self.total_cost_in_word.delete("1.0", tk.END)  # Clear existing text
-        self.total_cost_in_word.insert(tk.END, number_to_words(total_cost))
+        self.bill_total_cost = bill_total(self.line_items)
+        self.schedule_total_refresh()
 
     # Inside the __init__ method, add the following lines to link the recalculate_total_cost function to the trace of
     # cost variables:
@@ -802,36 +919,39 @@ class BillInformationApp:
         self.second_right_row_number += 1
 
     def reload_accessory_dropdown(self):
-        stock_df = self.stock_df.loc[(self.stock_df['S. No.'] >= 200) & (~self.stock_df['Name of Item'].isna())]
-        new_options = list(stock_df['Name of Item'].values)
-        new_options.sort()
-        if len(new_options) == len(self.accessories_items):
+        new_options = list(self.master_data['accessory_items'])
+        if new_options == self.accessories_items:
             return
         # Clear existing options and set new options
         self.accessories_items.clear()
         self.accessories_items.extend(new_options)
 
-        # Set the dropdown to the first item in the new options
-        if self.accessories_items:
+        # Keep the current choice if it survived the refresh, otherwise fall back to the first item
+        if self.accessories_items and self.accessory_var.get() not in self.accessories_items:
             self.accessory_var.set(self.accessories_items[0])
 
-        # Configure the dropdown to use the updated options
-        self.accessory_layer_dropdown["values"] = self.accessories_items
+        # Re-index only the names that changed, the dropdown shows the best matches for what is typed
+        self.accessory_layer_dropdown.set_items(self.accessories_items)
+
+    def search_max_matches(self):
+        """How many matches the type-ahead dropdowns list, from the 'search_max_matches' row of Configs"""
+        try:
+            return max(1, int(self.get_config_value('search_max_matches', 50)))
+        except (TypeError, ValueError):
+            return 50
 
     def create_accessories_dropdown(self):
 
-        stock_df = self.stock_df.loc[(self.stock_df['S. No.'] >= 200) & (~self.stock_df['Name of Item'].isna())]
-        self.accessories_items = list(stock_df['Name of Item'].values)
-        self.accessories_items.sort()
+        self.accessories_items = list(self.master_data['accessory_items'])
 
         label = tk.Label(self.root, text="Accessories:", anchor="w", justify="left")
         label.grid(row=self.right_row_number, column=2, padx=3, pady=3, sticky="e")
         label.config(font=("times new roman", 12))
 
         self.accessory_var = tk.StringVar()
-        self.accessory_layer_dropdown = ttk.Combobox(self.root, textvariable=self.accessory_var,
-                                                     values=self.accessories_items,
-                                                     state='readonly', justify='center')
+        self.accessory_layer_dropdown = SearchableCombobox(self.root, items=self.accessories_items,
+                                                           max_matches=self.search_max_matches(),
+                                                           textvariable=self.accessory_var, justify='center')
         self.accessory_var.set(self.accessories_items[0])
         self.accessory_layer_dropdown.grid(row=self.right_row_number, column=3, padx=3, pady=3, sticky="e")
         self.accessory_layer_dropdown.config(font=("times new roman", 12))
@@ -871,13 +991,8 @@ class BillInformationApp:
 
     def update_embroidery_cost(self, *args):
         try:
-            quantity = self.embroidery_in_hrs_var.get() if isinstance(self.embroidery_in_hrs_var.get(), int) else 0
-            if isinstance(quantity, int):
-                price = self.embroidery_in_hrs_var.get() * self.embroidery_var.get()
-                self.embroidery_cost_var.set(price)
-            else:
-                self.embroidery_in_hrs_var.set(0)
-        except ValueError:
+            self.embroidery_cost_var.set(hourly_cost(self.embroidery_in_hrs_var.get(), self.embroidery_var.get()))
+        except (ValueError, tk.TclError):
             self.embroidery_in_hrs_var.set(0)
 
     def generate_embroidery_cost(self):
@@ -977,9 +1092,11 @@ class BillInformationApp:
             raise SystemExit
 
     def update_fixed_price(self, *args):
-        pattern_dress = self.pattern_var.get()
-        if self.pattern_price_hash_data.get(pattern_dress):
-            self.fixed_cost_var.set(self.pattern_price_hash_data[pattern_dress])
+        if self.pattern_var.get() not in self.dress_pattern_combobox.index.items:
+            return  # Half typed, the box settles on a pattern when it is left
+        pattern_rate = self.price_catalog.pattern_rate(self.pattern_var.get())
+        if pattern_rate:
+            self.fixed_cost_var.set(pattern_rate)
             self.update_state('disabled')
             self.layer_var.set("")
         else:
@@ -988,28 +1105,17 @@ class BillInformationApp:
             self.fixed_cost_var.set(0)
 
     def update_accessory_price(self, *args):
-        layer = self.layer_var.get()
-        if self.layer_price_hash_data.get(layer):
-            self.accessory_price_var.set(self.layer_price_hash_data[layer] * self.accessory_quantity_var.get())
-        else:
-            self.accessory_price_var.set(0)
+        accessory_rate = self.price_catalog.accessory_rate(self.accessory_var.get())
+        self.accessory_price_var.set(rate_amount(accessory_rate, self.accessory_quantity_var.get()))
 
     def update_layer_price(self, *args):
-        layer = self.layer_var.get()
-        if self.layer_price_hash_data.get(layer):
-            self.price_var.set(self.layer_price_hash_data[layer] * self.quantity_var.get())
-        else:
-            self.price_var.set(0)
+        layer_rate = self.price_catalog.layer_rate(self.layer_var.get())
+        self.price_var.set(rate_amount(layer_rate, self.quantity_var.get()))
 
     def update_machine_cost(self, *args):
         try:
-            quantity = self.machine_in_hours_var.get() if isinstance(self.machine_in_hours_var.get(), int) else 0
-            if isinstance(quantity, int):
-                price = self.machine_in_hours_var.get() * self.machine_hr_var.get()
-                self.machine_cost_var.set(price)
-            else:
-                self.machine_cost_var.set(0)
-        except ValueError:
+            self.machine_cost_var.set(hourly_cost(self.machine_in_hours_var.get(), self.machine_hr_var.get()))
+        except (ValueError, tk.TclError):
             self.machine_cost_var.set(0)
 
     def generate_machine_cost(self):
@@ -1083,35 +1189,31 @@ class BillInformationApp:
         self.right_row_number += 1
 
     def reload_client_names_dropdown(self):
-        df = self.client_df.loc[~self.client_df['Client Names'].isna()]
-        new_options = list(df['Client Names'].values)
-        new_options.sort()
-        if len(new_options) == len(self.client_names):
+        new_options = list(self.master_data['client_names'])
+        if new_options == self.client_names:
             return
         # Clear existing options and set new options
         self.client_names.clear()
         self.client_names.extend(new_options)
 
-        # Set the dropdown to the first item in the new options
-        if self.client_names:
+        # Keep the current choice if it survived the refresh, otherwise fall back to the first item
+        if self.client_names and self.client_name_var.get() not in self.client_names:
             self.client_name_var.set(self.client_names[0])
 
-        # Configure the dropdown to use the updated options
-        self.client_name_combobox["values"] = self.client_names
+        # Re-index only the names that changed, the dropdown shows the best matches for what is typed
+        self.client_name_combobox.set_items(self.client_names)
 
     def create_client_label_and_entry(self):
-        df = self.client_df.loc[~self.client_df['Client Names'].isna()]
-
-        self.client_names = list(df['Client Names'].values)
-        self.client_names.sort()
+        self.client_names = list(self.master_data['client_names'])
 
         label = tk.Label(self.root, text='Client Name:', anchor="w", justify="left")
         label.grid(row=0, column=4, padx=3, pady=3, sticky="e")
         label.config(font=("times new roman", 12))
 
         self.client_name_var = tk.StringVar()
-        self.client_name_combobox = ttk.Combobox(self.root, textvariable=self.client_name_var, values=self.client_names,
-                                                 state="readonly")
+        self.client_name_combobox = SearchableCombobox(self.root, items=self.client_names,
+                                                       max_matches=self.search_max_matches(),
+                                                       textvariable=self.client_name_var)
         self.client_name_combobox.set(self.client_names[0])
         self.client_name_combobox.grid(row=0, column=5, padx=3, pady=3, sticky="e")
         self.client_name_combobox.config(font=("times new roman", 12))
@@ -1139,36 +1241,20 @@ class BillInformationApp:
         self.calendar.config(font=("times new roman", 12))
         self.right_row_number += 1
 
-    def update_layer_prices_hash_map(self, df):
-        for row in df.iterrows():
-            data_dict = row[1].to_dict()
-            piece_rate = data_dict['Selling Price of Material / Mtr']
-            if not pd.isna(piece_rate) and piece_rate != '-':
-                self.layer_price_hash_data[data_dict['Name of Item']] = piece_rate
-
-    def update_piece_prices_hash_map(self, df):
-        for row in df.iterrows():
-            data_dict = row[1].to_dict()
-            piece_rate = data_dict['Rate/ Piece']
-            if not pd.isna(piece_rate):
-                self.pattern_price_hash_data[data_dict['Dress Patterns']] = piece_rate
-
     def reload_dress_pattern_dropdown(self):
-        df = self.data_df.loc[~self.data_df['Dress Patterns'].isna()]
-        new_options = list(df['Dress Patterns'].values)
-        new_options.sort()
-        if len(new_options) == len(self.dress_pattern_values):
+        new_options = list(self.master_data['dress_patterns'])
+        if new_options == self.dress_pattern_values:
             return
         # Clear existing options and set new options
         self.dress_pattern_values.clear()
         self.dress_pattern_values.extend(new_options)
 
-        # Set the dropdown to the first item in the new options
-        if self.dress_pattern_values:
+        # Keep the current choice if it survived the refresh, otherwise fall back to the first item
+        if self.dress_pattern_values and self.pattern_var.get() not in self.dress_pattern_values:
             self.pattern_var.set(self.dress_pattern_values[0])
 
-        # Configure the dropdown to use the updated options
-        self.dress_pattern_combobox["values"] = self.dress_pattern_values
+        # Re-index only the names that changed, the dropdown shows the best matches for what is typed
+        self.dress_pattern_combobox.set_items(self.dress_pattern_values)
 
     def create_dress_pattern_combobox(self):
         self.row_number += 1
@@ -1176,15 +1262,12 @@ class BillInformationApp:
         label.grid(row=self.row_number, column=0, padx=3, pady=3, sticky="e")
         label.config(font=("times new roman", 12))
 
-        df = self.data_df.loc[~self.data_df['Dress Patterns'].isna()]
-
-        self.dress_pattern_values = list(df['Dress Patterns'].values)
-        self.dress_pattern_values.sort()
+        self.dress_pattern_values = list(self.master_data['dress_patterns'])
 
         self.pattern_var = tk.StringVar()
-        self.dress_pattern_combobox = ttk.Combobox(self.root, textvariable=self.pattern_var,
-                                                   values=self.dress_pattern_values,
-                                                   state="readonly")
+        self.dress_pattern_combobox = SearchableCombobox(self.root, items=self.dress_pattern_values,
+                                                         max_matches=self.search_max_matches(),
+                                                         textvariable=self.pattern_var)
         self.dress_pattern_combobox.set(self.dress_pattern_values[0])
         self.dress_pattern_combobox.grid(row=self.row_number, column=1, padx=3, pady=3, sticky="e")
         self.dress_pattern_combobox.config(font=("times new roman", 12))
@@ -1211,36 +1294,33 @@ class BillInformationApp:
         self.create_calculated_price()
 
     def reload_layer_dropdown(self):
-        stock_df = self.stock_df[(self.stock_df['S. No.'] <= 200) & (~self.stock_df['Name of Item'].isna())]
-        new_options = list(stock_df['Name of Item'].values)
-        new_options.sort()
-        if len(new_options) == len(self.layer_options):
+        new_options = list(self.master_data['layer_options'])
+        if new_options == self.layer_options:
             return
 
         # Clear existing options and set new options
         self.layer_options.clear()
         self.layer_options.extend(new_options)
 
-        # Set the dropdown to the first item in the new options
-        if self.layer_options:
+        # Keep the current choice if it survived the refresh, otherwise fall back to the first item
+        if self.layer_options and self.layer_var.get() not in self.layer_options:
             self.layer_var.set(self.layer_options[0])
 
-        # Configure the dropdown to use the updated options
-        self.layer_dropdown["values"] = self.layer_options
+        # Re-index only the names that changed, the dropdown shows the best matches for what is typed
+        self.layer_dropdown.set_items(self.layer_options)
 
     def create_dropdown_layer(self):
 
-        stock_df = self.stock_df[(self.stock_df['S. No.'] <= 200) & (~self.stock_df['Name of Item'].isna())]
-        self.layer_options = list(stock_df['Name of Item'].values)
-        self.layer_options.sort()
+        self.layer_options = list(self.master_data['layer_options'])
 
         label = tk.Label(self.root, text="Layer:", anchor="w", justify="left")
         label.grid(row=self.row_number, column=0, padx=3, pady=3, sticky="e")
         label.config(font=("times new roman", 12))
 
         self.layer_var = tk.StringVar()
-        self.layer_dropdown = ttk.Combobox(self.root, textvariable=self.layer_var, values=self.layer_options,
-                                           state='readonly')
+        self.layer_dropdown = SearchableCombobox(self.root, items=self.layer_options,
+                                                 max_matches=self.search_max_matches(),
+                                                 textvariable=self.layer_var)
 
         self.layer_var.set(self.layer_options[0])
         self.layer_dropdown.grid(row=self.row_number, column=1, padx=3, pady=3, sticky="e")
@@ -1279,21 +1359,16 @@ class BillInformationApp:
 
     def add_accessory(self):
         # self.update_accessory_cost()
+        if not self.commit_choice(self.accessory_layer_dropdown, "accessory"):
+            return
         accessory = self.accessory_var.get()
         quantity = self.accessory_quantity_var.get()
         price = self.accessory_price_var.get()
         layer_data = (accessory, quantity, price)
 
-        dress_name = self.pattern_var.get()
-        piece_name = self.piece_var.get()
-        layer_name = self.layer_var.get()
-        self.tuple_key = (dress_name, piece_name, layer_name)
-        if self.tuple_key in self.accessory_data_dict:
-            self.accessory_data_dict[self.tuple_key].append(layer_data)
-        else:
-            self.accessory_data_dict[self.tuple_key] = [layer_data]
-
-        self.accessory_listbox.insert("", "end", values=layer_data)
+        # Held on the draft until Add Layer creates the line, the listbox row shares its id
+        accessory_id = self.line_items.add_draft_accessory(layer_data)
+        self.accessory_rows.upsert(accessory_id, layer_data)
 
         delete_button = tk.Button(self.root, text="Delete Acrs.", command=self.delete_accessory)
         delete_button.grid(row=self.row_number, column=3, padx=3, pady=3, columnspan=2)
@@ -1331,6 +1406,7 @@ class BillInformationApp:
 
         # Configure the Treeview widget to span the entire first column
         self.accessory_listbox.grid(row=self.row_number + 3, column=3, columnspan=2, padx=3, pady=3, sticky='nsew')
+        self.accessory_rows = TreeviewModel(self.accessory_listbox)
 
     def create_layer_list(self):
         column_names = ["Dress Pattern", "Piece", "Layer", "Total Cost"]  # , "Quantity", "Piece Price"
@@ -1347,6 +1423,7 @@ class BillInformationApp:
 
         self.treeview.grid(row=self.row_number + 3, column=0, columnspan=3, padx=3, pady=3, sticky='nsew')
         self.treeview.bind("<Double-1>", self.show_record_popup)
+        self.line_rows = TreeviewModel(self.treeview)
 
         # Configure the Treeview widget to span the entire first column
 
@@ -1355,9 +1432,9 @@ class BillInformationApp:
             return
         selected_item = self.treeview.selection()
         if selected_item:
-            # Get the record associated with the selected item
-            index = int(self.treeview.index(selected_item[0]))
-            selected_record = self.source_data_list[index]
+            # The Treeview iid is the line's id in the line item store
+            self.editing_line_id = selected_item[0]
+            selected_record = self.line_items.get(self.editing_line_id)
 
             # Open the Record Editor Popup
             RecordEditorPopup(self.root, selected_record, self.on_popup_closed)
@@ -1365,20 +1442,15 @@ class BillInformationApp:
 
     def on_popup_closed(self, updated_record):
         self.is_popped_up = False
-        if updated_record is not None:
-            # Update the Treeview with the modified record
-            selected_item = self.treeview.selection()
-            index = int(self.treeview.index(selected_item[0]))
-            self.treeview.item(selected_item, values=updated_record)
-
+        line_id, self.editing_line_id = self.editing_line_id, None
+        if updated_record is not None and line_id in self.line_items:
             # Replace the existing record with the updated one
-            self.source_data_list[index] = {key: value for key, value in zip(self.invoice_data_fields, updated_record)}
-            self.recalculate_total_cost()
+            new_record = {key: value for key, value in zip(self.invoice_data_fields, updated_record)}
+            old_record = self.line_items.update(line_id, new_record)
+            self.add_to_total_cost(line_total(new_record) - line_total(old_record))
 
-    @staticmethod
-    def clear_treeview(tree_view_obj):
-        for item_id in tree_view_obj.get_children():
-            tree_view_obj.delete(item_id)
+            # Update the Treeview with the grid columns of the modified record, like every other row
+            self.line_rows.upsert(line_id, line_row(new_record))
 
     def add_datas_to_tuples(self):
         self.invoice_data_fields = ['dress_pattern', 'piece_name', 'layer_name', 'total_cost',
@@ -1406,66 +1478,35 @@ class BillInformationApp:
         # accessory_name = self.accessory_var.get()
         # accessory_qnty = self.accessory_quantity_var.get()
         # accessory_price = self.accessory_price_var.get()
-        self.piece_cost_sum = 0
-
-        default_clear_fields = [self.piece_var, self.price_var, self.machine_cost_var, self.embroidery_cost_var,
-                                self.embroidery_material_cost_var, self.dying_var, self.other_cost_var,
-                                self.fixed_cost_var, self.accessory_price_var]
-        seq = 1
-        for field in default_clear_fields:
-            if seq not in [1, 9]:
-                try:
-                    value_data = float(field.get())
-                except Exception as e:
-                    print(e)
-                    value_data = 0
-                self.piece_cost_sum += value_data
-            if seq == 1:
-                field.set("")
-            else:
-                field.set(0)
-
-            seq += 1
-        tuple_key = (dress_pattern, piece_name, layer_name)
-        for accessory_price_value in self.accessory_data_dict.get(tuple_key, []):
-            self.piece_cost_sum += accessory_price_value[-1]
-        tuple_values = (dress_pattern, piece_name, layer_name, self.piece_cost_sum,
-                        layer_qnty, layer_price, machine_hours, machine_cost, embroidery_hours, embroidery_cost,
-                        embroidery_material_cost, dying_charges, other_cost, fixed_cost,
-                        self.accessory_data_dict.get(tuple_key, tuple()))
+        accessories = self.line_items.draft_accessory_list()
+        line_item = LineItem(dress_pattern, piece_name, layer_name, 0, layer_qnty, layer_price, machine_hours,
+                             machine_cost, embroidery_hours, embroidery_cost, embroidery_material_cost, dying_charges,
+                             other_cost, fixed_cost, accessories)
+        self.piece_cost_sum = line_item.price()
 
-        data_dict = {}
-        for key, value in zip(self.invoice_data_fields, tuple_values):
-            data_dict[key] = value
+        self.piece_var.set("")
+        for field in [self.price_var, self.machine_cost_var, self.embroidery_cost_var,
+                      self.embroidery_material_cost_var, self.dying_var, self.other_cost_var,
+                      self.fixed_cost_var, self.accessory_price_var]:
+            field.set(0)
 
-        self.source_data_list.append(data_dict)
-        self.clear_treeview(self.accessory_listbox)
+        line_id = self.line_items.add(line_item.to_record())  # Takes the draft accessories along
+        self.accessory_rows.clear()
+        return line_id
 
     def update_treeview(self):
-        # Clear existing items in the Treeview
-        self.treeview.delete(*self.treeview.get_children())
-
-        dress_pattern = self.pattern_var.get()
-        piece = self.piece_var.get()
-        layer = self.layer_var.get()
-        quantity = self.quantity_var.get()
-
-        layer_data = (dress_pattern, piece, layer, quantity, self.piece_cost_sum)
-
-        for item in self.source_data_list:
-            self.treeview.insert("", "end", values=item)
+        # Only the rows that differ from what the Treeview shows are touched, on the next idle
+        self.line_rows.set_rows((line_id, line_row(item)) for line_id, item in self.line_items.lines.items())
 
     def add_layer(self):
         # self.update_layer_cost()
-        dress_pattern = self.pattern_var.get()
-        piece = self.piece_var.get()
-        layer = self.layer_var.get()
-        piece_price = self.price_var.get()
-        quantity = self.quantity_var.get()
-
-        self.add_datas_to_tuples()
-        layer_data = (dress_pattern, piece, layer, self.piece_cost_sum, quantity, piece_price)
-        self.treeview.insert("", "end", values=layer_data[:4])
+        if not self.commit_choice(self.dress_pattern_combobox, "dress pattern"):
+            return
+        fixed_price = self.price_catalog.pattern_rate(self.pattern_var.get())
+        if not fixed_price and not self.commit_choice(self.layer_dropdown, "layer"):
+            return  # Fixed price patterns leave the layer blank on purpose
+        line_id = self.add_datas_to_tuples()
+        self.line_rows.upsert(line_id, line_row(self.line_items.get(line_id)))
 
         delete_button = tk.Button(self.root, text="Delete Layer", command=self.delete_layer)
         delete_button.grid(row=self.row_number, column=1, padx=3, pady=3, columnspan=2)
@@ -1477,19 +1518,17 @@ class BillInformationApp:
             width=10,  # Set the width of the button
             borderwidth=2,  # Border width
         )
-        self.recalculate_total_cost()
+        self.add_to_total_cost(line_total(self.line_items.get(line_id)))
 
     def delete_accessory(self):
         selected_index = self.accessory_listbox.selection()
         if selected_index:
             price = 0
             for item in selected_index:
-                values = self.accessory_listbox.item(item, "values")
-                if self.tuple_key in self.accessory_data_dict and values in self.accessory_data_dict[self.tuple_key]:
-                    self.accessory_data_dict[self.tuple_key].remove(values)
+                values = self.line_items.remove_draft_accessory(item)
                 if values:
                     price += int(values[2])  # Assuming "Price" is the 4th column (0-based index)
-                self.accessory_listbox.delete(item)
+                self.accessory_rows.remove(item)
 
             # Subtract the total selected layer prices from the total layer cost
             # final_layer_cost = self.total_accessory_cost_var.get() - price
@@ -1502,15 +1541,11 @@ class BillInformationApp:
         selected_index = self.treeview.selection()
         if selected_index:
             for item in selected_index:
-                values = self.treeview.item(item, "values")
-                self.treeview.delete(item)
-                for index, data in enumerate(self.source_data_list):
-                    if (data['dress_pattern'], data['piece_name'], data['layer_name']) == values[:3]:
-                        self.source_data_list.pop(index)
-                        break
+                self.line_rows.remove(item)
+                if item in self.line_items:
+                    self.add_to_total_cost(-line_total(self.line_items.remove(item)))
 
         self.quantity_var.set(0)  # Reset the quantity field
-        self.recalculate_total_cost()
 
     def create_total_cost_for_accessories(self):
         self.total_accessory_cost_var = tk.IntVar(value=0)  # Initialize with zero
@@ -1562,10 +1597,24 @@ class BillInformationApp:
 
         # Set the window size
         self.root.geometry(f"{window_width}x{window_height}")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if self.profiler is not None:
+            self.root.after(0, self.report_startup_profile)
         self.root.mainloop()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Malar Vikram billing")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print how long imports, workbook load and widget construction take, "
+                             "then close once the first window is drawn")
+    args = parser.parse_args()
+
+    startup_profiler = None
+    if args.profile_startup:
+        startup_profiler = StartupProfiler(STARTUP_STARTED)
+        startup_profiler.mark('imports', at=IMPORTS_FINISHED)
+
     root = tk.Tk()
-    app = BillInformationApp(root)
+    app = BillInformationApp(root, startup_profiler)
     app.run()
@@ -0,0 +1,271 @@
+import os
+import sqlite3
+
+from file_lock import FileLock
+from invoice_journal import InvoiceJournal, parse_bill_no
+
+LINE_ITEM_FIELDS = ['dress_pattern', 'piece_name', 'layer_name', 'total_cost', 'layer_qnty', 'layer_price',
+                    'machine_hours', 'machine_cost', 'embroidery_hours', 'embroidery_cost', 'embroidery_material_cost',
+                    'dying_charges', 'other_cost', 'fixed_cost']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    bill_no TEXT NOT NULL UNIQUE,
+    financial_year TEXT,
+    bill_number INTEGER,
+    client_name TEXT,
+    bill_date TEXT,
+    total_cost REAL
+);
+CREATE TABLE IF NOT EXISTS line_items (
+    id INTEGER PRIMARY KEY,
+    invoice_id INTEGER NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    dress_pattern TEXT,
+    piece_name TEXT,
+    layer_name TEXT,
+    total_cost REAL,
+    layer_qnty REAL,
+    layer_price REAL,
+    machine_hours REAL,
+    machine_cost REAL,
+    embroidery_hours REAL,
+    embroidery_cost REAL,
+    embroidery_material_cost REAL,
+    dying_charges REAL,
+    other_cost REAL,
+    fixed_cost REAL
+);
+CREATE TABLE IF NOT EXISTS accessories (
+    id INTEGER PRIMARY KEY,
+    line_item_id INTEGER NOT NULL REFERENCES line_items(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    accessory_name TEXT,
+    quantity REAL,
+    price REAL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    financial_year TEXT PRIMARY KEY,
+    last_bill_no INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_client_name ON invoices(client_name);
+CREATE INDEX IF NOT EXISTS idx_invoices_bill_date ON invoices(bill_date);
+CREATE INDEX IF NOT EXISTS idx_line_items_invoice_id ON line_items(invoice_id, position);
+CREATE INDEX IF NOT EXISTS idx_line_items_dress_pattern ON line_items(dress_pattern);
+CREATE INDEX IF NOT EXISTS idx_accessories_line_item_id ON accessories(line_item_id, position);
+"""
+
+
+class SqliteInvoiceStore:
+    """Invoice store on the standard library sqlite3, normalised into invoices, line items and accessories.
+
+    Has the same save/read methods as InvoiceJournal so the app can use either one.
+    """
+
+    def __init__(self, database_path, database_file='Invoice_Datas.sqlite3', legacy_file='Invoice_Datas.json',
+                 read_only=False):
+        self.database_path = database_path
+        self.sqlite_path = os.path.join(database_path, database_file)
+        self.legacy_file = legacy_file
+        self.lock = FileLock(f'{self.sqlite_path}.lock')
+        self.connection = None
+        self.read_only = read_only
+
+    def open(self):
+        if self.read_only:
+            self.connection = sqlite3.connect(f'file:{self.sqlite_path}?mode=ro', uri=True)
+            self.connection.row_factory = sqlite3.Row
+            return self
+        if not os.path.exists(self.database_path):
+            os.makedirs(self.database_path)
+        self.connection = sqlite3.connect(self.sqlite_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=FULL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+        with self.lock:
+            if self.is_empty():
+                self.import_journal()
+            else:
+                # A crash after an import left the journal behind, the database already has its bills
+                self.retire_journal()
+        return self
+
+    def refresh(self):
+        """Nothing is cached in memory, every read already sees the other counters' commits"""
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def is_empty(self):
+        return self.connection.execute('SELECT 1 FROM invoices LIMIT 1').fetchone() is None
+
+    def import_journal(self):
+        """Copies bills from the json journal (or the old json file) the first time the sqlite engine is used.
+
+        The journal is then moved aside, so picking the journal engine again imports these
+        bills back instead of reading a journal that stopped at the switch.
+        """
+        journal = InvoiceJournal(self.database_path, legacy_file=self.legacy_file, import_from_sqlite=False)
+        if not os.path.exists(journal.journal_path) and not os.path.exists(journal.legacy_path):
+            return
+        journal.open()
+        with self.connection:
+            for entry in journal.iter_entries():
+                self.insert_invoice(entry['bill_no'], entry['records'], entry.get('client_name'),
+                                    entry.get('bill_date'))
+            for key, value in journal.counters.items():
+                if key.endswith('_last_bill_no'):
+                    self.update_counter(key[:-len('_last_bill_no')], int(value))
+        self.retire_journal()
+
+    def retire_journal(self):
+        for path in InvoiceJournal(self.database_path, legacy_file=self.legacy_file).data_files():
+            if os.path.exists(path):
+                os.replace(path, f'{path}.migrated')
+
+    def insert_invoice(self, bill_no, records, client_name=None, bill_date=None):
+        """Saves one bill; saving a bill number again replaces it, the last save wins like in the journal"""
+        financial_year, bill_number = parse_bill_no(bill_no)
+        total_cost = 0
+        for record in records:
+            try:
+                total_cost += float(record.get('total_cost', 0))
+            except (TypeError, ValueError):
+                continue
+
+        # Its line items and accessories go with it through ON DELETE CASCADE, in the caller's transaction
+        self.connection.execute('DELETE FROM invoices WHERE bill_no = ?', (bill_no,))
+        cursor = self.connection.execute(
+            'INSERT INTO invoices (bill_no, financial_year, bill_number, client_name, bill_date, total_cost) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (bill_no, financial_year, bill_number, client_name, bill_date, total_cost))
+        invoice_id = cursor.lastrowid
+
+        for position, record in enumerate(records):
+            cursor = self.connection.execute(
+                f'INSERT INTO line_items (invoice_id, position, {", ".join(LINE_ITEM_FIELDS)}) '
+                f'VALUES (?, ?, {", ".join("?" * len(LINE_ITEM_FIELDS))})',
+                (invoice_id, position, *[record.get(field) for field in LINE_ITEM_FIELDS]))
+            line_item_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO accessories (line_item_id, position, accessory_name, quantity, price) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(line_item_id, accessory_position, *accessory[:3])
+                 for accessory_position, accessory in enumerate(record.get('accessories') or [])])
+
+        if bill_number is not None:
+            self.update_counter(financial_year, bill_number)
+        return invoice_id
+
+    def update_counter(self, financial_year, bill_number):
+        self.connection.execute(
+            'INSERT INTO counters (financial_year, last_bill_no) VALUES (?, ?) '
+            'ON CONFLICT(financial_year) DO UPDATE SET last_bill_no = MAX(last_bill_no, excluded.last_bill_no)',
+            (financial_year, bill_number))
+
+    def append_invoice(self, bill_no, records, client_name=None, bill_date=None):
+        if self.read_only:
+            raise PermissionError(f"Invoice database '{self.sqlite_path}' is closed for new bills")
+        with self.lock, self.connection:
+            self.insert_invoice(bill_no, records, client_name, bill_date)
+
+    def compact(self):
+        """Reclaims free pages and leaves a single file behind, so it can be opened read-only later"""
+        with self.lock:
+            self.connection.execute('VACUUM')
+            self.connection.execute('ANALYZE')
+            self.connection.execute('PRAGMA journal_mode=DELETE')
+
+    def data_files(self):
+        return [self.sqlite_path, f'{self.sqlite_path}-wal', f'{self.sqlite_path}-shm']
+
+    def last_bill_no(self, financial_year):
+        row = self.connection.execute('SELECT last_bill_no FROM counters WHERE financial_year = ?',
+                                      (financial_year,)).fetchone()
+        return int(row['last_bill_no']) if row else 0
+
+    def read_records(self, invoice_ids):
+        """Rebuilds the [line dict, ...] list of each invoice, accessories as (name, quantity, price) tuples"""
+        records_by_invoice = {invoice_id: [] for invoice_id in invoice_ids}
+        if not invoice_ids:
+            return records_by_invoice
+        placeholders = ', '.join('?' * len(invoice_ids))
+        line_rows = self.connection.execute(
+            f'SELECT * FROM line_items WHERE invoice_id IN ({placeholders}) ORDER BY invoice_id, position',
+            invoice_ids).fetchall()
+
+        accessories_by_line = {}
+        line_ids = [row['id'] for row in line_rows]
+        for start in range(0, len(line_ids), 500):
+            chunk = line_ids[start:start + 500]
+            for row in self.connection.execute(
+                    f'SELECT * FROM accessories WHERE line_item_id IN ({", ".join("?" * len(chunk))}) '
+                    f'ORDER BY line_item_id, position', chunk):
+                accessories_by_line.setdefault(row['line_item_id'], []).append(
+                    (row['accessory_name'], row['quantity'], row['price']))
+
+        for row in line_rows:
+            record = {field: row[field] for field in LINE_ITEM_FIELDS}
+            record['accessories'] = accessories_by_line.get(row['id'], [])
+            records_by_invoice[row['invoice_id']].append(record)
+        return records_by_invoice
+
+    def query_entries(self, where='', params=(), batch_size=500):
+        """Yields journal style entries for the invoices matching the where clause, in save order"""
+        cursor = self.connection.execute(
+            f'SELECT id, bill_no, client_name, bill_date FROM invoices {where} ORDER BY id', params)
+        while True:
+            invoice_rows = cursor.fetchmany(batch_size)
+            if not invoice_rows:
+                break
+            records_by_invoice = self.read_records([row['id'] for row in invoice_rows])
+            for row in invoice_rows:
+                yield {
+                    'bill_no': row['bill_no'],
+                    'client_name': row['client_name'],
+                    'bill_date': row['bill_date'],
+                    'records': records_by_invoice[row['id']],
+                }
+
+    def find_invoices(self, client_name=None, date_from=None, date_to=None, dress_pattern=None):
+        """Indexed lookup by client, bill date range (iso strings) and dress pattern"""
+        conditions = []
+        params = []
+        if client_name is not None:
+            conditions.append('client_name = ?')
+            params.append(client_name)
+        if date_from is not None:
+            conditions.append('bill_date >= ?')
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append('bill_date <= ?')
+            params.append(date_to)
+        if dress_pattern is not None:
+            conditions.append('id IN (SELECT invoice_id FROM line_items WHERE dress_pattern = ?)')
+            params.append(dress_pattern)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self.query_entries(where, params)
+
+    def get_invoice(self, bill_no):
+        """Returns one bill through the unique index on bill_no, or None"""
+        for entry in self.query_entries('WHERE bill_no = ?', (bill_no,)):
+            return entry
+        return None
+
+    def iter_entries(self):
+        return self.query_entries()
+
+    def iter_results(self):
+        for entry in self.iter_entries():
+            yield {entry['bill_no']: entry['records']}
+
+    def load(self):
+        database_datas = {'results': list(self.iter_results())}
+        for row in self.connection.execute('SELECT financial_year, last_bill_no FROM counters'):
+            database_datas[f'{row["financial_year"]}_last_bill_no'] = str(row['last_bill_no'])
+        return database_datas
@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import shutil
+import stat
+
+from file_lock import FileLock
+from invoice_journal import InvoiceJournal, parse_bill_no, write_json_atomic
+from invoice_sqlite import SqliteInvoiceStore
+
+STORAGE_ENGINES = {
+    'journal': InvoiceJournal,
+    'sqlite': SqliteInvoiceStore,
+}
+
+FINANCIAL_YEAR_PATTERN = re.compile(r'^\d{2}-\d{2}$')
+
+
+def entry_matches(entry, client_name=None, date_from=None, date_to=None, dress_pattern=None):
+    bill_date = entry.get('bill_date') or ''
+    if client_name is not None and entry.get('client_name') != client_name:
+        return False
+    if date_from is not None and bill_date < date_from:
+        return False
+    if date_to is not None and bill_date > date_to:
+        return False
+    if dress_pattern is not None and all(record.get('dress_pattern') != dress_pattern
+                                         for record in entry['records']):
+        return False
+    return True
+
+
+class PartitionedInvoiceStore:
+    """Keeps every financial year's bills in its own folder, Database/<yy-yy>/.
+
+    Saves only touch the partition of the bill's year, so they cost the same in the
+    tenth year as in the first. Years before the current one are compacted once,
+    marked closed and from then on only opened read-only, with the engine that wrote
+    them. Reads across years fan out over the partitions oldest first.
+    """
+
+    def __init__(self, database_path, engine='journal', legacy_file='Invoice_Datas.json',
+                 current_financial_year=None, closed_marker='CLOSED', staging_folder='Migrating'):
+        self.database_path = database_path
+        self.engine = engine
+        self.engine_class = STORAGE_ENGINES[engine]
+        self.legacy_file = legacy_file
+        self.current_financial_year = current_financial_year
+        self.closed_marker = closed_marker
+        self.staging_path = os.path.join(database_path, staging_folder)
+        self.lock = FileLock(os.path.join(database_path, 'Invoice_Partitions.lock'))
+        self.partitions = {}
+
+    def open(self):
+        if not os.path.exists(self.database_path):
+            os.makedirs(self.database_path)
+        with self.lock:
+            self.migrate_unpartitioned()
+            if self.current_financial_year:
+                for financial_year in self.financial_years():
+                    if financial_year < self.current_financial_year and not self.is_closed(financial_year):
+                        self.close_partition(financial_year)
+        return self
+
+    def partition_path(self, financial_year):
+        return os.path.join(self.database_path, financial_year)
+
+    def is_closed(self, financial_year):
+        return os.path.exists(os.path.join(self.partition_path(financial_year), self.closed_marker))
+
+    def partition_engine_class(self, financial_year):
+        """The engine of a closed year is the one that wrote it, from its marker or else its files.
+
+        An open year uses the configured engine, which imports the other engine's bills on open.
+        """
+        if not self.is_closed(financial_year):
+            return self.engine_class
+        try:
+            with open(os.path.join(self.partition_path(financial_year), self.closed_marker), 'r',
+                      encoding='utf-8') as f:
+                engine = json.load(f).get('engine')
+        except (OSError, ValueError, AttributeError):
+            engine = None
+        if engine not in STORAGE_ENGINES:
+            sqlite_store = SqliteInvoiceStore(self.partition_path(financial_year))
+            engine = 'sqlite' if os.path.exists(sqlite_store.sqlite_path) else 'journal'
+        return STORAGE_ENGINES[engine]
+
+    def financial_years(self):
+        return sorted(name for name in os.listdir(self.database_path)
+                      if FINANCIAL_YEAR_PATTERN.match(name) and os.path.isdir(self.partition_path(name)))
+
+    def partition(self, financial_year):
+        """Opens (once) and returns the store of one financial year"""
+        store = self.partitions.get(financial_year)
+        if store is None:
+            store = self.partition_engine_class(financial_year)(
+                self.partition_path(financial_year), legacy_file=self.legacy_file,
+                read_only=self.is_closed(financial_year)).open()
+            self.partitions[financial_year] = store
+        return store
+
+    def migrate_unpartitioned(self):
+        """Splits a single Database/ store (journal, sqlite or the old json file) into yearly partitions.
+
+        The partitions are built in a staging folder and only moved into place once it holds
+        every bill. A crash while staging leaves the flat store untouched and the next start
+        begins again; a crash while moving finishes the moves on the next start.
+        """
+        flat_sqlite = SqliteInvoiceStore(self.database_path, legacy_file=self.legacy_file)
+        flat_journal = InvoiceJournal(self.database_path, legacy_file=self.legacy_file)
+        if os.path.exists(flat_sqlite.sqlite_path):
+            flat_store = flat_sqlite
+        elif os.path.exists(flat_journal.journal_path) or os.path.exists(flat_journal.legacy_path):
+            flat_store = flat_journal
+        else:
+            flat_store = None
+        complete_marker = os.path.join(self.staging_path, 'COMPLETE')
+        staged = os.path.exists(complete_marker)
+        if flat_store is None and not staged:
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            return
+
+        if not staged:
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            self.stage_partitions(flat_store)
+            write_json_atomic(complete_marker, {'engine': self.engine})
+        for financial_year in sorted(os.listdir(self.staging_path)):
+            if FINANCIAL_YEAR_PATTERN.match(financial_year):
+                self.install_staged_partition(financial_year)
+
+        for path in flat_sqlite.data_files() + flat_journal.data_files():
+            if os.path.exists(path):
+                os.replace(path, f'{path}.migrated')
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+
+    def stage_partitions(self, flat_store):
+        staged_stores = {}
+        flat_store.open()
+        for entry in flat_store.iter_entries():
+            financial_year = parse_bill_no(entry['bill_no'])[0] or self.current_financial_year
+            store = staged_stores.get(financial_year)
+            if store is None:
+                store = self.engine_class(os.path.join(self.staging_path, financial_year),
+                                          legacy_file=self.legacy_file).open()
+                staged_stores[financial_year] = store
+            store.append_invoice(entry['bill_no'], entry['records'], client_name=entry.get('client_name'),
+                                 bill_date=entry.get('bill_date'))
+        for store in list(staged_stores.values()) + [flat_store]:
+            if hasattr(store, 'close'):
+                store.close()
+
+    def install_staged_partition(self, financial_year):
+        """Moves a staged year into place, or merges it into a partition that already exists"""
+        staged_path = os.path.join(self.staging_path, financial_year)
+        if not os.path.exists(self.partition_path(financial_year)):
+            os.replace(staged_path, self.partition_path(financial_year))
+            return
+        staged_store = self.engine_class(staged_path, legacy_file=self.legacy_file).open()
+        partition = self.partition(financial_year)
+        latest_entries = {entry['bill_no']: entry for entry in staged_store.iter_entries()}  # Last save wins
+        for entry in latest_entries.values():
+            # Bills already there came from an interrupted merge, adding them again would duplicate them
+            if partition.get_invoice(entry['bill_no']) is None:
+                partition.append_invoice(entry['bill_no'], entry['records'], client_name=entry.get('client_name'),
+                                         bill_date=entry.get('bill_date'))
+        if hasattr(staged_store, 'close'):
+            staged_store.close()
+        shutil.rmtree(staged_path)
+
+    def close_partition(self, financial_year):
+        """Compacts a finished year and makes its files read-only"""
+        store = self.partitions.pop(financial_year, None)
+        if store is None:
+            store = self.engine_class(self.partition_path(financial_year), legacy_file=self.legacy_file).open()
+        store.compact()
+        if hasattr(store, 'close'):
+            store.close()
+
+        write_json_atomic(os.path.join(self.partition_path(financial_year), self.closed_marker),
+                          {'financial_year': financial_year, 'engine': self.engine})
+        for path in store.data_files():
+            if os.path.exists(path):
+                os.chmod(path, stat.S_IREAD)
+
+    def refresh(self):
+        for store in self.partitions.values():
+            store.refresh()
+
+    def append_invoice(self, bill_no, records, client_name=None, bill_date=None):
+        financial_year = parse_bill_no(bill_no)[0] or self.current_financial_year
+        with self.lock:
+            self.partition(financial_year).append_invoice(bill_no, records, client_name=client_name,
+                                                          bill_date=bill_date)
+
+    def last_bill_no(self, financial_year):
+        if not os.path.isdir(self.partition_path(financial_year)):
+            return 0
+        return self.partition(financial_year).last_bill_no(financial_year)
+
+    def get_invoice(self, bill_no):
+        financial_year = parse_bill_no(bill_no)[0]
+        if financial_year is None or not os.path.isdir(self.partition_path(financial_year)):
+            return None
+        return self.partition(financial_year).get_invoice(bill_no)
+
+    def iter_entries(self, financial_years=None):
+        """Yields entries of the given years (all years by default), oldest year first"""
+        for financial_year in self.financial_years():
+            if financial_years is None or financial_year in financial_years:
+                yield from self.partition(financial_year).iter_entries()
+
+    def find_invoices(self, financial_years=None, client_name=None, date_from=None, date_to=None,
+                      dress_pattern=None):
+        """Bills matching the filters, fanned out over the yearly partitions.
+
+        Uses the sqlite indexes when that engine is configured and a scan of the journal otherwise.
+        """
+        for financial_year in self.financial_years():
+            if financial_years is not None and financial_year not in financial_years:
+                continue
+            store = self.partition(financial_year)
+            if hasattr(store, 'find_invoices'):
+                yield from store.find_invoices(client_name=client_name, date_from=date_from, date_to=date_to,
+                                               dress_pattern=dress_pattern)
+                continue
+            for entry in store.iter_entries():
+                if entry_matches(entry, client_name, date_from, date_to, dress_pattern):
+                    yield entry
+
+    def iter_results(self, financial_years=None):
+        for entry in self.iter_entries(financial_years):
+            yield {entry['bill_no']: entry['records']}
+
+    def load(self):
+        database_datas = {'results': list(self.iter_results())}
+        for financial_year in self.financial_years():
+            database_datas[f'{financial_year}_last_bill_no'] = str(self.last_bill_no(financial_year))
+        return database_datas
+
+
+def open_invoice_store(database_path, engine='journal', legacy_file='Invoice_Datas.json',
+                       current_financial_year=None):
+    """Opens the invoice store picked by the 'storage_engine' row of the Configs sheet, partitioned by year.
+
+    A typo in the row falls back to the journal with a warning instead of stopping the start up;
+    the journal imports the bills of a sqlite store it finds, so no bill number is handed out twice.
+    """
+    engine = (engine or 'journal').strip().lower()
+    if engine not in STORAGE_ENGINES:
+        print(f"Unknown storage engine '{engine}', expected one of {', '.join(STORAGE_ENGINES)}; using journal")
+        engine = 'journal'
+    return PartitionedInvoiceStore(database_path, engine, legacy_file=legacy_file,
+                                   current_financial_year=current_financial_year).open()
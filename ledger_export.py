@@ -0,0 +1,94 @@
+"""Exports the line items of saved bills into one ledger workbook or csv file.
+
+    python ledger_export.py --financial-year 24-25 --output "Bill Details/Ledger_24-25.xlsx"
+    python ledger_export.py --client "Client A" --date-from 2024-04-01 --date-to 2024-06-30 --output ledger.csv
+"""
+import argparse
+import csv
+import os
+import time
+
+from invoice_sqlite import LINE_ITEM_FIELDS
+
+LEDGER_COLUMNS = ['bill_no', 'client_name', 'bill_date'] + LINE_ITEM_FIELDS + ['accessories']
+LEDGER_FORMATS = ('xlsx', 'csv')
+
+
+def accessories_text(accessories):
+    return '; '.join(f'{accessory[0]} x {accessory[1]} @ {accessory[2]}' for accessory in accessories or [])
+
+
+def iter_ledger_rows(entries):
+    """One row per line item, in the order of LEDGER_COLUMNS"""
+    for entry in entries:
+        prefix = [entry['bill_no'], entry.get('client_name') or '', entry.get('bill_date') or '']
+        for record in entry['records']:
+            yield prefix + [record.get(field) for field in LINE_ITEM_FIELDS] + \
+                [accessories_text(record.get('accessories'))]
+
+
+def write_ledger_csv(rows, output_path):
+    count = 0
+    with open(output_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(LEDGER_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_ledger_xlsx(rows, output_path):
+    from openpyxl import Workbook
+
+    # Write-only mode streams each row to the file, memory stays flat however many rows there are
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Ledger')
+    worksheet.freeze_panes = 'A2'
+    worksheet.append(LEDGER_COLUMNS)
+    count = 0
+    for row in rows:
+        worksheet.append(row)
+        count += 1
+    workbook.save(output_path)
+    return count
+
+
+def ledger_format(output_path):
+    extension = os.path.splitext(output_path)[1].lstrip('.').lower()
+    if extension not in LEDGER_FORMATS:
+        raise ValueError(f"Ledger must be a .xlsx or .csv file, got '{output_path}'")
+    return extension
+
+
+def export_ledger(invoice_store, output_path, financial_years=None, client_name=None, date_from=None, date_to=None):
+    """Streams the matching bills from the invoice store into output_path, returns the number of rows"""
+    writer = write_ledger_csv if ledger_format(output_path) == 'csv' else write_ledger_xlsx
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    entries = invoice_store.find_invoices(financial_years=financial_years, client_name=client_name,
+                                          date_from=date_from, date_to=date_to)
+    return writer(iter_ledger_rows(entries), output_path)
+
+
+def main():
+    from batch_render import open_services
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', required=True, help='.xlsx or .csv file to write')
+    parser.add_argument('--financial-year', action='append', help='yy-yy, may be repeated; all years by default')
+    parser.add_argument('--client', help='only this client')
+    parser.add_argument('--date-from', help='first bill date, YYYY-MM-DD')
+    parser.add_argument('--date-to', help='last bill date, YYYY-MM-DD')
+    args = parser.parse_args()
+
+    _, invoice_store = open_services()
+    started = time.perf_counter()
+    count = export_ledger(invoice_store, args.output, args.financial_year, args.client, args.date_from, args.date_to)
+    elapsed = time.perf_counter() - started
+    print(f'{args.output}: {count} line items in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+LINE_ROW_FIELDS = ('dress_pattern', 'piece_name', 'layer_name', 'total_cost')
+
+
+def line_row(record):
+    """The values a line shows in the layer grid"""
+    return tuple(record.get(field) for field in LINE_ROW_FIELDS)
+
+
+class LineItemStore:
+    """The lines of the bill being entered, in order, keyed by an id that is also their Treeview iid.
+
+    Accessories are collected on a draft before their line exists (the form adds them
+    first) and attach to the line's id when it is added, so two lines with the same
+    pattern, piece and layer never share or lose accessories. Every operation is a
+    dict lookup, however long the bill.
+    """
+
+    def __init__(self, prefix='line'):
+        self.prefix = prefix
+        self.lines = {}  # id -> record, dicts keep insertion order
+        self.draft_accessories = {}  # accessory id -> (name, quantity, price)
+        self.next_id = 1
+
+    def new_id(self, kind):
+        item_id = f'{self.prefix}-{kind}-{self.next_id}'
+        self.next_id += 1
+        return item_id
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines.values())
+
+    def __contains__(self, line_id):
+        return line_id in self.lines
+
+    def ids(self):
+        return list(self.lines)
+
+    def records(self):
+        return list(self.lines.values())
+
+    def get(self, line_id):
+        return self.lines[line_id]
+
+    def add(self, record):
+        """Adds the record with the draft accessories attached, returns its id"""
+        line_id = self.new_id('l')
+        record['accessories'] = list(self.draft_accessories.values())
+        self.draft_accessories = {}
+        self.lines[line_id] = record
+        return line_id
+
+    def update(self, line_id, record):
+        """Replaces a line in place, returns the old record"""
+        old_record = self.lines[line_id]
+        self.lines[line_id] = record
+        return old_record
+
+    def remove(self, line_id):
+        return self.lines.pop(line_id)
+
+    def add_draft_accessory(self, accessory):
+        accessory_id = self.new_id('a')
+        self.draft_accessories[accessory_id] = accessory
+        return accessory_id
+
+    def remove_draft_accessory(self, accessory_id):
+        return self.draft_accessories.pop(accessory_id, None)
+
+    def draft_accessory_list(self):
+        return list(self.draft_accessories.values())
+
+    def clear(self):
+        self.lines = {}
+        self.draft_accessories = {}
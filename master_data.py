@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+from invoice_journal import write_json_atomic
+from price_catalog import pattern_rates, stock_rates
+
+SNAPSHOT_VERSION = 5
+
+SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def to_native(value):
+    """json default= hook for the numpy scalars and timestamps pandas hands back"""
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def build_pattern_section(data_df):
+    df = data_df.loc[~data_df['Dress Patterns'].isna()]
+    return {
+        'dress_patterns': sorted(df['Dress Patterns'].values),
+        'pattern_prices': pattern_rates(data_df),
+    }
+
+
+def build_stock_section(stock_df):
+    named = stock_df.loc[~stock_df['Name of Item'].isna()]
+    layer_prices, accessory_prices = stock_rates(stock_df)
+    return {
+        'layer_options': sorted(named.loc[named['S. No.'] <= 200, 'Name of Item'].values),
+        'accessory_items': sorted(named.loc[named['S. No.'] >= 200, 'Name of Item'].values),
+        'layer_prices': layer_prices,
+        'accessory_prices': accessory_prices,
+    }
+
+
+def build_client_section(client_df):
+    df = client_df.loc[~client_df['Client Names'].isna()].fillna('')
+    return {
+        'client_names': sorted(df['Client Names'].values),
+        'clients': {record['Client Names']: record for record in df.to_dict('records')},
+    }
+
+
+def build_company_section(company_df):
+    records = company_df.fillna('').to_dict('records')
+    # The invoice has always used the last row of the sheet
+    return {'company_profile': records[-1] if records else {}}
+
+
+def build_config_section(config_df):
+    df = config_df.loc[~config_df['type'].isna() & ~config_df['value'].isna()]
+    return {'configs': dict(zip(df['type'], df['value']))}
+
+
+SHEET_BUILDERS = {
+    'Data & Assumption': build_pattern_section,
+    'Stock Statement': build_stock_section,
+    'Client Details': build_client_section,
+    'Company Details': build_company_section,
+    'Configs': build_config_section,
+}
+
+
+def merge_sections(sections):
+    master_data = {}
+    for sheet_name in SHEET_BUILDERS:
+        master_data.update(sections[sheet_name])
+    return master_data
+
+
+def read_shared_strings(workbook_zip):
+    """The shared string table as a list of plain texts, rich text runs joined"""
+    try:
+        shared_strings_xml = ElementTree.fromstring(workbook_zip.read('xl/sharedStrings.xml'))
+    except KeyError:
+        return []
+    return [''.join(text.text or '' for text in item.iter(f'{SPREADSHEET_NS}t'))
+            for item in shared_strings_xml.iter(f'{SPREADSHEET_NS}si')]
+
+
+def cell_values_hash(sheet_file, shared_strings):
+    """sha256 of a worksheet's cell references and values, shared string indexes resolved to their text"""
+    sha256 = hashlib.sha256()
+    for _, cell in ElementTree.iterparse(sheet_file):
+        if cell.tag != f'{SPREADSHEET_NS}c':
+            continue
+        cell_type = cell.get('t', 'n')
+        value = cell.find(f'{SPREADSHEET_NS}v')
+        value = (value.text or '') if value is not None else ''
+        if cell_type == 's' and value:
+            cell_type, value = 'str', shared_strings[int(value)]
+        elif cell_type == 'inlineStr':
+            cell_type, value = 'str', ''.join(text.text or '' for text in cell.iter(f'{SPREADSHEET_NS}t'))
+        sha256.update(f'{cell.get("r")}\t{cell_type}\t{value}\n'.encode('utf-8'))
+        cell.clear()
+    return sha256.hexdigest()
+
+
+def sheet_fingerprints(workbook_path, sheet_names):
+    """Per sheet change detection straight from the xlsx zip, much cheaper than pandas.
+
+    A sheet's fingerprint hashes the values of its own cells, with shared strings looked
+    up. Editing the text of one sheet rewrites the shared strings part every sheet points
+    into, yet only changes that sheet's fingerprint; formatting changes none.
+    """
+    with zipfile.ZipFile(workbook_path) as workbook_zip:
+        workbook_xml = ElementTree.fromstring(workbook_zip.read('xl/workbook.xml'))
+        relationships_xml = ElementTree.fromstring(workbook_zip.read('xl/_rels/workbook.xml.rels'))
+        targets = {relationship.get('Id'): relationship.get('Target')
+                   for relationship in relationships_xml.iter(f'{PACKAGE_RELATIONSHIP_NS}Relationship')}
+        shared_strings = read_shared_strings(workbook_zip)
+
+        fingerprints = {}
+        for sheet in workbook_xml.iter(f'{SPREADSHEET_NS}sheet'):
+            if sheet.get('name') not in sheet_names:
+                continue
+            target = targets[sheet.get(f'{RELATIONSHIP_NS}id')]
+            part_name = target.lstrip('/') if target.startswith('/') else posixpath.join('xl', target)
+            with workbook_zip.open(part_name) as sheet_file:
+                fingerprints[sheet.get('name')] = cell_values_hash(sheet_file, shared_strings)
+    return fingerprints
+
+
+class MasterDataSnapshot:
+    """Compiled copy of the catalog in User_Input_datas.xlsx, stored as json next to the invoices.
+
+    The snapshot is keyed by the workbook's mtime and sha256, so a warm start only
+    stats the workbook and loads a small json file. When the content did change,
+    per sheet fingerprints decide which sheets pandas has to parse again; the
+    sections of the other sheets are reused from the snapshot.
+    """
+
+    def __init__(self, workbook_path, snapshot_path):
+        self.workbook_path = workbook_path
+        self.snapshot_path = snapshot_path
+        self.changed_sheets = []
+        self.loaded_key = None
+        self.lock = threading.Lock()
+
+    def workbook_key(self):
+        workbook_stat = os.stat(self.workbook_path)
+        return workbook_stat.st_mtime_ns, workbook_stat.st_size
+
+    def content_hash(self):
+        sha256 = hashlib.sha256()
+        with open(self.workbook_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def read_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def write_snapshot(self, snapshot):
+        snapshot_dir = os.path.dirname(self.snapshot_path)
+        if snapshot_dir and not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        snapshot = json.loads(json.dumps(snapshot, default=to_native))
+        write_json_atomic(self.snapshot_path, snapshot)
+        return snapshot
+
+    def build(self, sheet_names):
+        """Parses only the given sheets and returns {sheet name: section}"""
+        import pandas as pd  # Only needed when the workbook changed, a warm start never loads it
+
+        sections = {}
+        excel_file = pd.ExcelFile(self.workbook_path)
+        try:
+            for sheet_name in sheet_names:
+                sections[sheet_name] = SHEET_BUILDERS[sheet_name](pd.read_excel(excel_file, sheet_name))
+        finally:
+            excel_file.close()
+        return sections
+
+    def load_with_key(self):
+        """load() plus the workbook (mtime, size) the result belongs to, safe to call from any thread"""
+        with self.lock:
+            master_data = self.load()
+            return master_data, self.loaded_key
+
+    def load(self):
+        """Returns the catalog dict, re-parsing only the sheets whose content changed.
+
+        The names of those sheets are left in changed_sheets.
+        """
+        self.changed_sheets = []
+        workbook_stat = os.stat(self.workbook_path)
+        self.loaded_key = workbook_stat.st_mtime_ns, workbook_stat.st_size
+        snapshot = self.read_snapshot()
+        if snapshot and snapshot['mtime_ns'] == workbook_stat.st_mtime_ns and snapshot['size'] == workbook_stat.st_size:
+            return merge_sections(snapshot['sections'])
+
+        content_hash = self.content_hash()
+        if snapshot and snapshot['sha256'] == content_hash:
+            # Touched (copied, saved without edits) but not changed, only the mtime key moves
+            snapshot['mtime_ns'] = workbook_stat.st_mtime_ns
+            snapshot['size'] = workbook_stat.st_size
+            self.write_snapshot(snapshot)
+            return merge_sections(snapshot['sections'])
+
+        fingerprints = sheet_fingerprints(self.workbook_path, SHEET_BUILDERS)
+        sections = snapshot['sections'] if snapshot else {}
+        old_fingerprints = snapshot['fingerprints'] if snapshot else {}
+        self.changed_sheets = [sheet_name for sheet_name in SHEET_BUILDERS
+                               if sheet_name not in sections
+                               or fingerprints.get(sheet_name) != old_fingerprints.get(sheet_name)]
+        sections = {**sections, **self.build(self.changed_sheets)}
+
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'mtime_ns': workbook_stat.st_mtime_ns,
+            'size': workbook_stat.st_size,
+            'sha256': content_hash,
+            'fingerprints': fingerprints,
+            'sections': sections,
+        }
+        return merge_sections(self.write_snapshot(snapshot)['sections'])
+
+
+class ConfigService:
+    """Company profile, Configs values and the client index used on invoices, loaded once.
+
+    is_stale only stats the workbook, so generating an invoice does no spreadsheet
+    I/O unless somebody saved the workbook since the last load.
+    """
+
+    def __init__(self, master_data_snapshot):
+        self.master_data_snapshot = master_data_snapshot
+        self.master_data = None
+        self.workbook_key = None
+
+    def load(self):
+        self.set_master_data(*self.master_data_snapshot.load_with_key())
+        return self
+
+    def set_master_data(self, master_data, workbook_key):
+        self.master_data = master_data
+        self.workbook_key = workbook_key
+
+    def is_stale(self):
+        return self.master_data_snapshot.workbook_key() != self.workbook_key
+
+    def refresh_if_changed(self):
+        """Reloads when the workbook changed on disk, returns True if it did"""
+        if not self.is_stale():
+            return False
+        self.load()
+        return True
+
+    @property
+    def company_profile(self):
+        return self.master_data['company_profile']
+
+    def config_value(self, config_type, default=None):
+        return self.master_data['configs'].get(config_type, default)
+
+    def client_details(self, client_name):
+        return self.master_data['clients'].get(client_name, {})
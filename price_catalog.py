@@ -0,0 +1,78 @@
+LAYER_SERIAL_LIMIT = 200  # Stock Statement rows up to S. No. 200 are layers, from 200 on accessories
+
+
+def clean_rates(names, rates):
+    """Vectorised {name: rate} for two columns.
+
+    Rows without a name, a NaN rate or the '-' placeholder are dropped; any other
+    text in the rate column is treated as missing too instead of failing later.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rates = pd.to_numeric(rates.replace('-', np.nan), errors='coerce')
+    mask = names.notna().to_numpy() & rates.notna().to_numpy()
+    return dict(zip(names.to_numpy()[mask].tolist(), rates.to_numpy()[mask].tolist()))
+
+
+def stock_rates(stock_df):
+    """Returns (layer rates, accessory rates) from the Stock Statement sheet"""
+    import pandas as pd
+
+    serial_numbers = pd.to_numeric(stock_df['S. No.'], errors='coerce')
+    layer_rows = stock_df.loc[(serial_numbers <= LAYER_SERIAL_LIMIT).to_numpy()]
+    accessory_rows = stock_df.loc[(serial_numbers >= LAYER_SERIAL_LIMIT).to_numpy()]
+    return (clean_rates(layer_rows['Name of Item'], layer_rows['Selling Price of Material / Mtr']),
+            clean_rates(accessory_rows['Name of Item'], accessory_rows['Selling Price of Material / Mtr']))
+
+
+def pattern_rates(data_df):
+    """Returns the fixed {dress pattern: rate per piece} from the Data & Assumption sheet"""
+    return clean_rates(data_df['Dress Patterns'], data_df['Rate/ Piece'])
+
+
+class PriceCatalog:
+    """Layer, pattern and accessory rates behind O(1) lookups.
+
+    Every update replaces the maps instead of merging into them, so items deleted
+    from the workbook disappear, and bumps version so callers can tell a refresh happened.
+    """
+
+    def __init__(self):
+        self.layer_rates = {}
+        self.pattern_rates = {}
+        self.accessory_rates = {}
+        self.version = 0
+
+    @classmethod
+    def from_frames(cls, data_df=None, stock_df=None):
+        catalog = cls()
+        if stock_df is not None:
+            catalog.update_stock(stock_df)
+        if data_df is not None:
+            catalog.update_patterns(data_df)
+        return catalog
+
+    def update_stock(self, stock_df):
+        self.layer_rates, self.accessory_rates = stock_rates(stock_df)
+        self.version += 1
+
+    def update_patterns(self, data_df):
+        self.pattern_rates = pattern_rates(data_df)
+        self.version += 1
+
+    def update_from_master_data(self, master_data):
+        """Takes the rates compiled into the master data snapshot"""
+        self.layer_rates = dict(master_data['layer_prices'])
+        self.accessory_rates = dict(master_data['accessory_prices'])
+        self.pattern_rates = dict(master_data['pattern_prices'])
+        self.version += 1
+
+    def layer_rate(self, layer_name, default=0):
+        return self.layer_rates.get(layer_name, default)
+
+    def pattern_rate(self, dress_pattern, default=0):
+        return self.pattern_rates.get(dress_pattern, default)
+
+    def accessory_rate(self, accessory_name, default=0):
+        return self.accessory_rates.get(accessory_name, default)
@@ -0,0 +1,108 @@
+from invoice_sqlite import LINE_ITEM_FIELDS
+
+RECORD_FIELDS = LINE_ITEM_FIELDS + ['accessories']
+
+# What a piece costs: the layer price, the labour and material costs and the fixed pattern rate.
+# Hours and quantities only feed these, they are never added themselves.
+COST_FIELDS = ('layer_price', 'machine_cost', 'embroidery_cost', 'embroidery_material_cost', 'dying_charges',
+               'other_cost', 'fixed_cost')
+
+
+def rate_amount(rate, quantity):
+    """rate x quantity the way the cost boxes hold it, whole rupees truncated like a tk.IntVar"""
+    if not rate:
+        return 0
+    return int(rate * quantity)
+
+
+def hourly_cost(hours, rate_per_hour):
+    return int(hours * rate_per_hour)
+
+
+class Accessory:
+    __slots__ = ('name', 'quantity', 'price')
+
+    def __init__(self, name, quantity, price):
+        self.name = name
+        self.quantity = quantity
+        self.price = price
+
+    @classmethod
+    def from_value(cls, value):
+        """From the (name, quantity, price) tuples and lists bills store accessories as"""
+        return cls(*value[:3])
+
+    def as_tuple(self):
+        return self.name, self.quantity, self.price
+
+
+class LineItem:
+    """One piece of a bill, the same fields as a saved record with accessories as Accessory objects"""
+    __slots__ = tuple(RECORD_FIELDS)
+
+    def __init__(self, dress_pattern='', piece_name='', layer_name='', total_cost=0, layer_qnty=0, layer_price=0,
+                 machine_hours=0, machine_cost=0, embroidery_hours=0, embroidery_cost=0, embroidery_material_cost=0,
+                 dying_charges=0, other_cost=0, fixed_cost=0, accessories=()):
+        self.dress_pattern = dress_pattern
+        self.piece_name = piece_name
+        self.layer_name = layer_name
+        self.total_cost = total_cost
+        self.layer_qnty = layer_qnty
+        self.layer_price = layer_price
+        self.machine_hours = machine_hours
+        self.machine_cost = machine_cost
+        self.embroidery_hours = embroidery_hours
+        self.embroidery_cost = embroidery_cost
+        self.embroidery_material_cost = embroidery_material_cost
+        self.dying_charges = dying_charges
+        self.other_cost = other_cost
+        self.fixed_cost = fixed_cost
+        self.accessories = [value if isinstance(value, Accessory) else Accessory.from_value(value)
+                            for value in accessories or ()]
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(**{field: record[field] for field in RECORD_FIELDS if field in record})
+
+    @classmethod
+    def from_values(cls, values):
+        """From a list in RECORD_FIELDS order, like the record editor popup hands back"""
+        return cls(*values)
+
+    def to_record(self):
+        record = {field: getattr(self, field) for field in LINE_ITEM_FIELDS}
+        record['accessories'] = [accessory.as_tuple() for accessory in self.accessories]
+        return record
+
+    def piece_cost(self, number=float):
+        """Sum of the cost fields plus the accessory prices.
+
+        Adding a piece converts with float; the record editor works on the text of its
+        entries and converts with int, where a bad cost is an error but an unreadable
+        accessory price is skipped.
+        """
+        total = sum(number(getattr(self, field)) for field in COST_FIELDS)
+        for accessory in self.accessories:
+            try:
+                total += number(accessory.price)
+            except (TypeError, ValueError):
+                continue
+        return total
+
+    def price(self, number=float):
+        """Sets total_cost from the components and returns it"""
+        self.total_cost = self.piece_cost(number)
+        return self.total_cost
+
+
+def line_total(record):
+    """What one line adds to the bill, its total_cost truncated to whole rupees; an unreadable line adds 0"""
+    try:
+        return int(record.total_cost if isinstance(record, LineItem) else record['total_cost'])
+    except (TypeError, ValueError):
+        return 0
+
+
+def bill_total(records):
+    """The bill's taxable value"""
+    return sum(line_total(record) for record in records)
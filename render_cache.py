@@ -0,0 +1,123 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+RENDER_CACHE_PATH = os.path.join('Database', 'Render_Cache')
+
+engine_versions = {}
+
+
+def wkhtmltopdf_version(wkhtmltopdf=None):
+    """'wkhtmltopdf 0.12.6 (with patched qt)', asked once per binary and process"""
+    binary = wkhtmltopdf or 'wkhtmltopdf'
+    if binary not in engine_versions:
+        try:
+            output = subprocess.run([binary, '--version'], capture_output=True, text=True, timeout=10).stdout
+            engine_versions[binary] = output.strip() or 'unknown'
+        except (OSError, subprocess.SubprocessError):
+            engine_versions[binary] = 'unknown'
+    return engine_versions[binary]
+
+
+class RenderCache:
+    """Finished invoice PDFs keyed by a hash of what was rendered and the engine that rendered it.
+
+    A reprint of an unchanged invoice copies the cached PDF instead of running the
+    engine again. Entries are evicted once they have not been used for max_age_days,
+    and least recently used first whenever the folder grows past max_bytes. Several
+    processes may share the folder, entries are written to a temporary name and
+    renamed into place.
+    """
+
+    def __init__(self, cache_path=RENDER_CACHE_PATH, max_bytes=200 * 1024 * 1024, max_age_days=30,
+                 sweep_interval=3600):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = None
+        self.last_sweep = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(engine, engine_version, content):
+        sha256 = hashlib.sha256(f'{engine}\0{engine_version}\0'.encode('utf-8'))
+        sha256.update(content.encode('utf-8') if isinstance(content, str) else content)
+        return sha256.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_path, f'{key}.pdf')
+
+    def fetch(self, key, output_path):
+        """Copies the cached PDF to output_path, returns False on a miss"""
+        entry_path = self.entry_path(key)
+        try:
+            shutil.copyfile(entry_path, output_path)
+            os.utime(entry_path)  # Recently used, evicted last
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, pdf_path):
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path, exist_ok=True)
+        entry_path = self.entry_path(key)
+        temp_path = f'{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(pdf_path, temp_path)
+        os.replace(temp_path, entry_path)
+
+        with self.lock:
+            if self.total_bytes is not None:
+                self.total_bytes += os.path.getsize(entry_path)
+            due = (self.total_bytes is None or self.total_bytes > self.max_bytes
+                   or time.time() - self.last_sweep > self.sweep_interval)
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drops entries older than max_age, then the least recently used until under max_bytes"""
+        now = time.time()
+        entries = []
+        with os.scandir(self.cache_path) as scanned:
+            for entry in scanned:
+                if entry.name.endswith('.pdf'):
+                    entry_stat = entry.stat()
+                    entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+        entries.sort()
+
+        total_bytes = sum(size for _, size, _ in entries)
+        evicted = 0
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Another process evicted it first
+            total_bytes -= size
+            evicted += 1
+
+        with self.lock:
+            self.total_bytes = total_bytes
+            self.last_sweep = now
+            self.evictions += evicted
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,105 @@
+from xml.sax.saxutils import escape
+
+import reportlab
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+LAYOUT_VERSION = 2  # Bump with any change to the drawing below, the render cache keys on it
+ENGINE_VERSION = f'reportlab {reportlab.Version} layout {LAYOUT_VERSION}'
+
+PAGE_WIDTH = A4[0] - 30 * mm
+GRID_STYLE = [
+    ('GRID', (0, 0), (-1, -1), 0.75, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('TOPPADDING', (0, 0), (-1, -1), 3),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+]
+
+styles = getSampleStyleSheet()
+body_style = ParagraphStyle('InvoiceBody', parent=styles['Normal'], fontName='Helvetica', fontSize=10, leading=13)
+center_style = ParagraphStyle('InvoiceCenter', parent=body_style, alignment=TA_CENTER)
+title_style = ParagraphStyle('InvoiceTitle', parent=center_style, fontSize=12, leading=16)
+
+
+def text(value):
+    return escape('' if value is None else str(value))
+
+
+def bold(value):
+    return f'<b>{text(value)}</b>'
+
+
+def cell(markup, style=body_style):
+    return Paragraph(markup, style)
+
+
+def header_flowables(records):
+    return [
+        cell(bold('Tax Invoice'), title_style),
+        cell(bold(records['company_name']), title_style),
+        cell(f"<i>{text(records['address_line_1'])}</i>", center_style),
+        cell(f"<i>{text(records['address_line_2'])}</i>", center_style),
+        cell(bold(f"GSTN : {records['gstn_no']}"), center_style),
+        Spacer(1, 10 * mm),
+    ]
+
+
+def details_table(records):
+    rows = [
+        [cell(bold("Customer's Details:")), cell(bold('Invoice Details:'))],
+        [cell(f"{bold('Name: ')} {text(records['name'])}"), cell(bold(f"Bill No: {records['bill_no']}"))],
+        [cell(f"{bold('State: ')}{text(records['state'])}"),
+         cell(f"{bold('Bill Date: ')}{text(records['bill_date'])}")],
+        [cell(f"{bold('Email ID: ')}{text(records['email_id'])}"), ''],
+        [cell(f"{bold('Phone Number: ')}{text(records['phone_number'])}"), ''],
+    ]
+    table = Table(rows, colWidths=[PAGE_WIDTH * 0.63, PAGE_WIDTH * 0.37])
+    table.setStyle(TableStyle(GRID_STYLE))
+    return table
+
+
+def items_table(records):
+    rows = [[cell(bold('S. No')), cell(bold('Particulars')), cell(bold('Amount'))]]
+    for record in records['dress_records']:
+        rows.append([text(record['s_no']), cell(text(record['dress_pattern'])), text(record['total_cost'])])
+    table = Table(rows, colWidths=[PAGE_WIDTH * 0.2, PAGE_WIDTH * 0.32, PAGE_WIDTH * 0.48], repeatRows=1)
+    table.setStyle(TableStyle(GRID_STYLE))
+    return table
+
+
+def totals_table(records):
+    rows = [
+        [cell(bold('Taxable Value')), text(records['total_cost_for_client'])],
+        ['Other Charges', text(records['other_charges'])],
+        ['Invoice Value', text(records['invoice_value'])],
+        ['Amount Receivable', text(records['amount_receivable'])],
+        ['Amount in Words', cell(text(records['amount_in_words']))],
+    ]
+    table = Table(rows, colWidths=[PAGE_WIDTH * 0.47, PAGE_WIDTH * 0.53])
+    table.setStyle(TableStyle(GRID_STYLE + [('ALIGN', (1, 0), (1, -1), 'RIGHT')]))
+    return table
+
+
+def invoice_flowables(records):
+    """The blocks of invoice_template.html, top to bottom, for one invoice context"""
+    return header_flowables(records) + [
+        details_table(records),
+        Spacer(1, 12 * mm),
+        items_table(records),
+        Spacer(1, 12 * mm),
+        totals_table(records),
+        Spacer(1, 12 * mm),
+        cell(f"<b><i>{text('Thanks for the Order !!!')}</i></b>", center_style),
+    ]
+
+
+def render_invoice_pdf(context, output_path):
+    """Draws the invoice in-process, the same layout as the html template without wkhtmltopdf"""
+    doc = SimpleDocTemplate(output_path, pagesize=A4, leftMargin=15 * mm, rightMargin=15 * mm,
+                            topMargin=15 * mm, bottomMargin=15 * mm, title=f"Invoice {context['bill_no']}")
+    doc.build(invoice_flowables(context))
+    return output_path
@@ -0,0 +1,213 @@
+"""What-if repricing of saved bills against new stock rates.
+
+    python repricing.py --financial-year 24-25
+    python repricing.py --date-from 2024-04-01 --rate "Georget=145" --rate "Buttons=25" --machine-rate 800
+    python repricing.py --financial-year 24-25 --output "Bill Details/Repricing_24-25.csv"
+
+By default the rates of the current Input/User_Input_datas.xlsx are applied to the
+quantities stored in the bills, showing what each bill and dress pattern would cost today.
+"""
+import argparse
+import csv
+import time
+
+import numpy as np
+
+
+class LineItemArrays:
+    """Line items of many bills as flat NumPy columns, names replaced by indexes into small lists"""
+
+    def __init__(self):
+        self.bill_nos = []
+        self.dress_patterns = []
+        self.layer_names = []
+        self.accessory_names = []
+
+    @classmethod
+    def from_entries(cls, entries):
+        arrays = cls()
+        bill_index, pattern_index, layer_index = [], [], []
+        layer_qnty, layer_price, machine_hours, machine_cost, embroidery_hours, embroidery_cost = [], [], [], [], [], []
+        total_cost = []
+        accessory_line, accessory_index, accessory_quantity, accessory_price = [], [], [], []
+        patterns, layers, accessory_names = {}, {}, {}
+
+        for entry in entries:
+            bill = len(arrays.bill_nos)
+            arrays.bill_nos.append(entry['bill_no'])
+            for record in entry['records']:
+                line = len(bill_index)
+                bill_index.append(bill)
+                pattern_index.append(patterns.setdefault(record['dress_pattern'], len(patterns)))
+                layer_index.append(layers.setdefault(record.get('layer_name') or '', len(layers)))
+                layer_qnty.append(record.get('layer_qnty') or 0)
+                layer_price.append(record.get('layer_price') or 0)
+                machine_hours.append(record.get('machine_hours') or 0)
+                machine_cost.append(record.get('machine_cost') or 0)
+                embroidery_hours.append(record.get('embroidery_hours') or 0)
+                embroidery_cost.append(record.get('embroidery_cost') or 0)
+                total_cost.append(record.get('total_cost') or 0)
+                for accessory in record.get('accessories') or ():
+                    accessory_line.append(line)
+                    accessory_index.append(accessory_names.setdefault(accessory[0], len(accessory_names)))
+                    accessory_quantity.append(accessory[1])
+                    accessory_price.append(accessory[2])
+
+        arrays.dress_patterns = list(patterns)
+        arrays.layer_names = list(layers)
+        arrays.accessory_names = list(accessory_names)
+        arrays.bill_index = np.array(bill_index, dtype=np.int64)
+        arrays.pattern_index = np.array(pattern_index, dtype=np.int64)
+        arrays.layer_index = np.array(layer_index, dtype=np.int64)
+        arrays.layer_qnty = np.array(layer_qnty, dtype=np.float64)
+        arrays.layer_price = np.array(layer_price, dtype=np.float64)
+        arrays.machine_hours = np.array(machine_hours, dtype=np.float64)
+        arrays.machine_cost = np.array(machine_cost, dtype=np.float64)
+        arrays.embroidery_hours = np.array(embroidery_hours, dtype=np.float64)
+        arrays.embroidery_cost = np.array(embroidery_cost, dtype=np.float64)
+        arrays.total_cost = np.array(total_cost, dtype=np.float64)
+        arrays.accessory_line = np.array(accessory_line, dtype=np.int64)
+        arrays.accessory_index = np.array(accessory_index, dtype=np.int64)
+        arrays.accessory_quantity = np.array(accessory_quantity, dtype=np.float64)
+        arrays.accessory_price = np.array(accessory_price, dtype=np.float64)
+        return arrays
+
+    def __len__(self):
+        return len(self.bill_index)
+
+    @staticmethod
+    def price_vector(names, rates):
+        """Rates in the order of names, NaN where the new rates do not know the name"""
+        return np.array([rates.get(name, np.nan) for name in names], dtype=np.float64)
+
+
+class RepricingResult:
+    def __init__(self, arrays, line_delta, bill_old, bill_new, pattern_old, pattern_new):
+        self.bill_nos = arrays.bill_nos
+        self.dress_patterns = arrays.dress_patterns
+        self.line_delta = line_delta
+        self.bill_old = bill_old
+        self.bill_new = bill_new
+        self.pattern_old = pattern_old
+        self.pattern_new = pattern_new
+
+    @property
+    def bill_delta(self):
+        return self.bill_new - self.bill_old
+
+    @property
+    def pattern_delta(self):
+        return self.pattern_new - self.pattern_old
+
+    def bill_rows(self):
+        for bill_no, old, new in zip(self.bill_nos, self.bill_old.tolist(), self.bill_new.tolist()):
+            yield bill_no, int(old), int(new), int(new - old)
+
+    def pattern_rows(self):
+        for pattern, old, new in zip(self.dress_patterns, self.pattern_old.tolist(), self.pattern_new.tolist()):
+            yield pattern, int(old), int(new), int(new - old)
+
+
+def repriced_amount(rate_vector, index, quantity, old_amount):
+    """trunc(rate x quantity) like pricing.rate_amount, keeping the old amount where no new rate is known"""
+    rates = rate_vector[index] if len(rate_vector) else np.full(len(index), np.nan)
+    return np.where(np.isnan(rates), old_amount, np.trunc(np.nan_to_num(rates) * quantity))
+
+
+def reprice(arrays, layer_rates, accessory_rates=None, machine_rate=None, embroidery_rate=None):
+    """Applies new rates to every line item in one vectorised pass.
+
+    Layer and accessory prices follow the new rates (names the rates do not know keep
+    their price); machine and embroidery costs are repriced only when an hourly rate
+    is given. Line totals move by the change of their components and bills are
+    totalled like pricing.bill_total, truncating each line.
+    """
+    layer_vector = arrays.price_vector(arrays.layer_names, layer_rates)
+    line_delta = repriced_amount(layer_vector, arrays.layer_index, arrays.layer_qnty, arrays.layer_price) \
+        - arrays.layer_price
+
+    if machine_rate is not None:
+        line_delta += np.trunc(arrays.machine_hours * machine_rate) - arrays.machine_cost
+    if embroidery_rate is not None:
+        line_delta += np.trunc(arrays.embroidery_hours * embroidery_rate) - arrays.embroidery_cost
+
+    if accessory_rates is not None and len(arrays.accessory_line):
+        accessory_vector = arrays.price_vector(arrays.accessory_names, accessory_rates)
+        accessory_delta = repriced_amount(accessory_vector, arrays.accessory_index, arrays.accessory_quantity,
+                                          arrays.accessory_price) - arrays.accessory_price
+        line_delta += np.bincount(arrays.accessory_line, weights=accessory_delta, minlength=len(arrays))
+
+    old_line_total = np.trunc(arrays.total_cost)
+    new_line_total = np.trunc(arrays.total_cost + line_delta)
+    bill_count, pattern_count = len(arrays.bill_nos), len(arrays.dress_patterns)
+    return RepricingResult(
+        arrays, line_delta,
+        np.bincount(arrays.bill_index, weights=old_line_total, minlength=bill_count),
+        np.bincount(arrays.bill_index, weights=new_line_total, minlength=bill_count),
+        np.bincount(arrays.pattern_index, weights=old_line_total, minlength=pattern_count),
+        np.bincount(arrays.pattern_index, weights=new_line_total, minlength=pattern_count),
+    )
+
+
+def parse_rates(values):
+    rates = {}
+    for value in values or []:
+        name, _, rate = value.rpartition('=')
+        if not name:
+            raise ValueError(f"Expected NAME=RATE, got '{value}'")
+        rates[name] = float(rate)
+    return rates
+
+
+def main():
+    from batch_render import open_services
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--financial-year', action='append', help='yy-yy, may be repeated; all years by default')
+    parser.add_argument('--client', help='only this client')
+    parser.add_argument('--date-from', help='first bill date, YYYY-MM-DD')
+    parser.add_argument('--date-to', help='last bill date, YYYY-MM-DD')
+    parser.add_argument('--rate', action='append', help='NAME=RATE for a layer or accessory, overrides the workbook')
+    parser.add_argument('--machine-rate', type=float, help='new machine cost per hour')
+    parser.add_argument('--embroidery-rate', type=float, help='new embroidery cost per hour')
+    parser.add_argument('--top', type=int, default=20, help='bills with the largest change to list')
+    parser.add_argument('--output', help='csv file for the change of every bill')
+    args = parser.parse_args()
+
+    config_service, invoice_store = open_services()
+    overrides = parse_rates(args.rate)
+    layer_rates = {**config_service.master_data['layer_prices'], **overrides}
+    accessory_rates = {**config_service.master_data['accessory_prices'], **overrides}
+
+    started = time.perf_counter()
+    arrays = LineItemArrays.from_entries(invoice_store.find_invoices(
+        financial_years=args.financial_year, client_name=args.client, date_from=args.date_from, date_to=args.date_to))
+    loaded = time.perf_counter()
+    result = reprice(arrays, layer_rates, accessory_rates, args.machine_rate, args.embroidery_rate)
+    finished = time.perf_counter()
+
+    print(f'{len(arrays)} line items in {len(arrays.bill_nos)} bills: loaded in {loaded - started:.2f}s, '
+          f'repriced in {(finished - loaded) * 1000:.1f}ms')
+    print(f'Total {int(result.bill_old.sum())} -> {int(result.bill_new.sum())} '
+          f'({int(result.bill_delta.sum()):+d})')
+
+    print('\nBy dress pattern')
+    for pattern, old, new, delta in sorted(result.pattern_rows(), key=lambda row: -abs(row[3])):
+        print(f'  {pattern:<30} {old:>12} -> {new:>12} {delta:+12d}')
+
+    print('\nBills with the largest change')
+    bill_rows = list(result.bill_rows())
+    for position in np.argsort(-np.abs(result.bill_delta), kind='stable')[:args.top]:
+        bill_no, old, new, delta = bill_rows[position]
+        print(f'  {bill_no:<16} {old:>10} -> {new:>10} {delta:+10d}')
+
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['bill_no', 'old_total', 'new_total', 'change'])
+            writer.writerows(result.bill_rows())
+        print(f'\n{args.output}: {len(result.bill_nos)} bills')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Revenue and hours across saved bills, by client, dress pattern, layer and month.
+
+    python sales_analytics.py --by client
+    python sales_analytics.py --by month --financial-year 24-25
+    python sales_analytics.py --by dress_pattern --top 10 --rebuild
+
+The figures come from Database/<yy-yy>/Sales_Rollups.json, which every save updates
+with the new bill only, so a report does not re-read the invoices.
+"""
+import argparse
+import json
+import os
+import time
+
+from invoice_journal import parse_bill_no, write_json_atomic
+from invoice_storage import FINANCIAL_YEAR_PATTERN
+from pricing import line_total
+
+ROLLUP_VERSION = 2
+ROLLUP_FILE = 'Sales_Rollups.json'
+ROLLUP_DIMENSIONS = ('client', 'dress_pattern', 'layer', 'month')
+MEASURES = ('bills', 'lines', 'revenue', 'machine_hours', 'embroidery_hours')
+
+
+def empty_measures():
+    return dict.fromkeys(MEASURES, 0)
+
+
+def empty_year():
+    return {'last_bill_no': 0, 'totals': empty_measures(), 'by': {dimension: {} for dimension in ROLLUP_DIMENSIONS}}
+
+
+def well_formed_year(year):
+    """Whether a year read from the sidecar has the layout of empty_year, a damaged one is rebuilt"""
+    return (isinstance(year, dict) and isinstance(year.get('last_bill_no'), int)
+            and isinstance(year.get('totals'), dict) and set(MEASURES) <= set(year['totals'])
+            and isinstance(year.get('by'), dict)
+            and all(isinstance(year['by'].get(dimension), dict) for dimension in ROLLUP_DIMENSIONS))
+
+
+def number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class SalesRollups:
+    """Per financial year totals of every bill, kept in a json sidecar per year and grown one bill at a time.
+
+    Each year's rollups live in its partition folder, Database/<yy-yy>/Sales_Rollups.json.
+    Saving a bill folds only its own lines into its year and rewrites only that year's
+    file, so the cost of a save does not grow with the number of bills or years. Each
+    year remembers the last bill number it covers; bills another counter saved, or a
+    save whose rollup update failed, are caught up from the invoice store the next
+    time the rollups are used.
+    """
+
+    def __init__(self, database_path, rollup_file=ROLLUP_FILE):
+        self.database_path = database_path
+        self.rollup_file = rollup_file
+        self.years = {}
+        self.loaded_mtimes = {}  # Financial year -> mtime of its file when last read or written here
+        self.changed_years = set()
+
+    def year_path(self, financial_year):
+        return os.path.join(self.database_path, financial_year, self.rollup_file)
+
+    def load(self, financial_years=None):
+        """Reads the files of the given years (all years by default) that changed since they were last read here"""
+        if financial_years is None:
+            financial_years = set(self.years)
+            if os.path.isdir(self.database_path):
+                financial_years.update(name for name in os.listdir(self.database_path)
+                                       if FINANCIAL_YEAR_PATTERN.match(name))
+        for financial_year in financial_years:
+            self.load_year(financial_year)
+        return self
+
+    def load_year(self, financial_year):
+        path = self.year_path(financial_year)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self.years.pop(financial_year, None)
+            self.loaded_mtimes.pop(financial_year, None)
+            return
+        if mtime == self.loaded_mtimes.get(financial_year):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                rollup = json.load(f)
+        except (OSError, ValueError):
+            rollup = {}
+        # An unreadable file, one of an older layout or a damaged year is rebuilt by catch_up
+        year = rollup.get('year') if isinstance(rollup, dict) and rollup.get('version') == ROLLUP_VERSION else None
+        if well_formed_year(year):
+            self.years[financial_year] = year
+        else:
+            self.years.pop(financial_year, None)
+        self.loaded_mtimes[financial_year] = mtime
+
+    def save(self):
+        """Writes the files of the years changed since the last save, and only those"""
+        for financial_year in sorted(self.changed_years):
+            path = self.year_path(financial_year)
+            if financial_year in self.years and os.path.isdir(os.path.dirname(path)):
+                write_json_atomic(path, {'version': ROLLUP_VERSION, 'year': self.years[financial_year]})
+                self.loaded_mtimes[financial_year] = os.stat(path).st_mtime_ns
+        self.changed_years = set()
+
+    def add_invoice(self, bill_no, records, client_name=None, bill_date=None):
+        """Folds one bill into its year; a bill the year already covers is ignored"""
+        financial_year, bill_number = parse_bill_no(bill_no)
+        year = self.years.setdefault(financial_year, empty_year())
+        if bill_number is not None:
+            if bill_number <= year['last_bill_no']:
+                return False
+            year['last_bill_no'] = bill_number
+        self.changed_years.add(financial_year)
+
+        bill_keys = {'client': client_name or '', 'month': (bill_date or '')[:7] or 'Unknown'}
+        bill_measures = empty_measures()
+        seen = set()
+        for record in records:
+            line_measures = {'bills': 0, 'lines': 1, 'revenue': line_total(record),
+                             'machine_hours': number(record.get('machine_hours')),
+                             'embroidery_hours': number(record.get('embroidery_hours'))}
+            for dimension, key in (('dress_pattern', record.get('dress_pattern') or ''),
+                                   ('layer', record.get('layer_name') or '')):
+                measures = year['by'][dimension].setdefault(key, empty_measures())
+                if (dimension, key) not in seen:
+                    seen.add((dimension, key))
+                    measures['bills'] += 1
+                for measure in MEASURES[1:]:
+                    measures[measure] += line_measures[measure]
+            for measure in MEASURES[1:]:
+                bill_measures[measure] += line_measures[measure]
+        bill_measures['bills'] = 1
+
+        for measures in [year['totals']] + [year['by'][dimension].setdefault(key, empty_measures())
+                                            for dimension, key in bill_keys.items()]:
+            for measure in MEASURES:
+                measures[measure] += bill_measures[measure]
+        return True
+
+    def record_invoice(self, invoice_store, bill_no, records, client_name=None, bill_date=None):
+        """Adds a bill just saved to the store, call it under the store's lock.
+
+        Only the bill's own year is read and written. A year file that parses but is not
+        shaped like the rollups is rebuilt from every bill of that year.
+        """
+        financial_year, bill_number = parse_bill_no(bill_no)
+        self.load([financial_year])
+        prefix = str(bill_no).split('/')[0]
+        try:
+            covered = self.years.get(financial_year, {}).get('last_bill_no', 0)
+            if bill_number is not None and bill_number != covered + 1:
+                # Bills are missing before this one, the store has them all
+                self.catch_up(invoice_store, prefix, [financial_year])
+            else:
+                self.add_invoice(bill_no, records, client_name, bill_date)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            print(f'Sales rollups in {self.year_path(financial_year)} are damaged ({type(e).__name__}: {e}), '
+                  f'rebuilding them')
+            self.years.pop(financial_year, None)
+            self.catch_up(invoice_store, prefix, [financial_year])
+        self.save()
+
+    def catch_up(self, invoice_store, prefix='MV', financial_years=None):
+        """Folds in the bills of each year (all by default) the rollups have not seen; True if there were any.
+
+        Missing bills are read one by one by number. A year the rollups do not have, or
+        claim more bills of than the store holds, is rebuilt from all of its bills.
+        """
+        changed = False
+        store_years = invoice_store.financial_years()
+        for financial_year in list(self.years):
+            if financial_year not in store_years and (financial_years is None or financial_year in financial_years):
+                del self.years[financial_year]
+                changed = True
+        for financial_year in store_years:
+            if financial_years is not None and financial_year not in financial_years:
+                continue
+            last_bill_no = invoice_store.last_bill_no(financial_year)
+            year = self.years.get(financial_year)
+            if year is not None and year['last_bill_no'] == last_bill_no:
+                continue
+            if year is not None and year['last_bill_no'] < last_bill_no:
+                entries = (invoice_store.get_invoice(f'{prefix}/{financial_year}/{bill_number}')
+                           for bill_number in range(year['last_bill_no'] + 1, last_bill_no + 1))
+            else:
+                self.years[financial_year] = empty_year()
+                entries = invoice_store.iter_entries([financial_year])
+            for entry in entries:
+                if entry is not None:
+                    self.add_invoice(entry['bill_no'], entry['records'], entry.get('client_name'),
+                                     entry.get('bill_date'))
+            self.years[financial_year]['last_bill_no'] = last_bill_no
+            self.changed_years.add(financial_year)
+            changed = True
+        return changed
+
+    def refresh(self, invoice_store):
+        """Loads the year files and brings them up to date with the store, writing back under the store's lock"""
+        with invoice_store.lock:
+            invoice_store.refresh()
+            self.load()
+            if self.catch_up(invoice_store):
+                self.save()
+        return self
+
+    def financial_years(self):
+        return sorted(self.years)
+
+    def totals(self, financial_years=None):
+        totals = empty_measures()
+        for financial_year, year in self.years.items():
+            if financial_years is None or financial_year in financial_years:
+                for measure in MEASURES:
+                    totals[measure] += year['totals'][measure]
+        return totals
+
+    def report(self, dimension, financial_years=None):
+        """(key, measures) pairs of one dimension over the given years, largest revenue first"""
+        if dimension not in ROLLUP_DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dimension}', expected one of {', '.join(ROLLUP_DIMENSIONS)}")
+        merged = {}
+        for financial_year, year in self.years.items():
+            if financial_years is None or financial_year in financial_years:
+                for key, measures in year['by'][dimension].items():
+                    totals = merged.setdefault(key, empty_measures())
+                    for measure in MEASURES:
+                        totals[measure] += measures[measure]
+        if dimension == 'month':
+            return sorted(merged.items())
+        return sorted(merged.items(), key=lambda item: (-item[1]['revenue'], item[0]))
+
+
+def main():
+    from batch_render import open_services
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--by', default='client', choices=ROLLUP_DIMENSIONS)
+    parser.add_argument('--financial-year', action='append', help='yy-yy, may be repeated; all years by default')
+    parser.add_argument('--top', type=int, help='only the first rows')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollups from every saved bill')
+    args = parser.parse_args()
+
+    _, invoice_store = open_services()
+    rollups = SalesRollups(invoice_store.database_path)
+    if args.rebuild:
+        for financial_year in invoice_store.financial_years():
+            if os.path.exists(rollups.year_path(financial_year)):
+                os.remove(rollups.year_path(financial_year))
+    started = time.perf_counter()
+    rollups.refresh(invoice_store)
+    rows = rollups.report(args.by, args.financial_year)
+    elapsed = time.perf_counter() - started
+
+    totals = rollups.totals(args.financial_year)
+    print(f"{totals['bills']} bills, {totals['lines']} line items, revenue {totals['revenue']}, machine "
+          f"{totals['machine_hours']:.1f}h, embroidery {totals['embroidery_hours']:.1f}h ({elapsed * 1000:.0f}ms)\n")
+    print(f"{args.by:<30} {'bills':>7} {'lines':>7} {'revenue':>12} {'machine h':>10} {'embroidery h':>13}")
+    for key, measures in rows[:args.top]:
+        print(f"{key or '-':<30} {measures['bills']:>7} {measures['lines']:>7} {measures['revenue']:>12} "
+              f"{measures['machine_hours']:>10.1f} {measures['embroidery_hours']:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import bisect
+import tkinter as tk
+from tkinter import ttk
+
+TRIGRAM_SIZE = 3
+
+
+def trigrams(text):
+    return {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+
+class SearchIndex:
+    """Prefix and substring lookups over a list of names, case-insensitive.
+
+    Prefixes are answered by bisecting a sorted list of the folded names, substrings of
+    three characters or more by intersecting trigram posting sets. update() only
+    touches the names that were added or removed since the last call.
+    """
+
+    def __init__(self, items=()):
+        self.keys = []  # Sorted (folded name, name) pairs
+        self.postings = {}  # trigram -> set of names
+        self.items = set()
+        self.update(items)
+
+    def update(self, items):
+        items = set(items)
+        removed = self.items - items
+        added = items - self.items
+        if len(removed) + len(added) > len(self.keys) // 2:
+            # Most of the catalog changed, sorting once is cheaper than that many inserts
+            self.keys = sorted((name.casefold(), name) for name in items)
+        else:
+            for name in removed:
+                position = bisect.bisect_left(self.keys, (name.casefold(), name))
+                del self.keys[position]
+            for name in added:
+                bisect.insort(self.keys, (name.casefold(), name))
+
+        for name in removed:
+            for trigram in trigrams(name.casefold()):
+                self.postings[trigram].discard(name)
+                if not self.postings[trigram]:
+                    del self.postings[trigram]
+        for name in added:
+            for trigram in trigrams(name.casefold()):
+                self.postings.setdefault(trigram, set()).add(name)
+        self.items = items
+        return bool(removed or added)
+
+    def prefix_matches(self, text):
+        text = text.casefold()
+        position = bisect.bisect_left(self.keys, (text,))
+        while position < len(self.keys) and self.keys[position][0].startswith(text):
+            yield self.keys[position][1]
+            position += 1
+
+    def substring_candidates(self, text):
+        if len(text) < TRIGRAM_SIZE:
+            return None
+        candidates = None
+        for trigram in sorted(trigrams(text), key=lambda t: len(self.postings.get(t, ()))):
+            candidates = set(self.postings.get(trigram, ())) if candidates is None \
+                else candidates & self.postings.get(trigram, set())
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, text, limit=50):
+        """Names starting with text first, then names containing it, both in sorted order, at most limit"""
+        text = text.strip()
+        if not text:
+            return [name for _, name in self.keys[:limit]]
+
+        matches = []
+        for name in self.prefix_matches(text):
+            matches.append(name)
+            if len(matches) >= limit:
+                return matches
+
+        folded = text.casefold()
+        candidates = self.substring_candidates(folded)
+        if candidates is None:
+            # Too short for a trigram, walk the sorted list
+            pool = self.keys
+        else:
+            pool = sorted((name.casefold(), name) for name in candidates)
+        for key, name in pool:
+            if folded in key and not key.startswith(folded):
+                matches.append(name)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+
+class SearchableCombobox(ttk.Combobox):
+    """Editable combobox that filters its drop-down through a SearchIndex as you type.
+
+    Only the best max_matches names are handed to Tk, so the list stays quick with
+    thousands of entries. Leaving the box with text that is not a known name picks
+    the first match, or goes back to the last valid choice when nothing matches.
+    Buttons do not take the focus, so handlers that read the value call commit() first.
+    """
+
+    def __init__(self, master, items=(), max_matches=50, **kwargs):
+        super().__init__(master, **kwargs)
+        self.max_matches = max_matches
+        self.index = SearchIndex(items)
+        self.last_valid = ''
+        self['values'] = self.index.search('', self.max_matches)
+        self.bind('<FocusIn>', self.remember_choice)
+        self.bind('<KeyRelease>', self.on_key_release)
+        self.bind('<<ComboboxSelected>>', self.on_selected)
+        self.bind('<FocusOut>', self.commit)
+        self.bind('<Return>', self.commit)
+
+    def set_items(self, items):
+        """Takes a refreshed catalog, re-indexing only what changed"""
+        if self.index.update(items):
+            self['values'] = self.index.search('', self.max_matches)
+
+    def set(self, value):
+        super().set(value)
+        self.last_valid = value
+
+    def remember_choice(self, event=None):
+        # The textvariable may have been set directly since the last commit
+        if self.get() in self.index.items:
+            self.last_valid = self.get()
+
+    def on_key_release(self, event):
+        if event.keysym in ('Return', 'Escape', 'Tab', 'Up', 'Down', 'Left', 'Right'):
+            return
+        self['values'] = self.index.search(self.get(), self.max_matches)
+
+    def on_selected(self, event=None):
+        self.last_valid = self.get()
+        self['values'] = self.index.search('', self.max_matches)
+
+    def commit(self, event=None):
+        """Settles typed text on a known name, returns False if the box is left without one"""
+        text = self.get()
+        if text in self.index.items:
+            self.last_valid = text
+        else:
+            matches = self.index.search(text, 1)
+            self.set(matches[0] if matches else self.last_valid)
+        self['values'] = self.index.search('', self.max_matches)
+        if event is not None and event.keysym == 'Return':
+            self.icursor(tk.END)
+        return self.get() in self.index.items
@@ -0,0 +1,25 @@
+import time
+
+
+class StartupProfiler:
+    """Collects how long each start up phase took, for the --profile-startup switch"""
+
+    def __init__(self, started):
+        self.started = started
+        self.last_mark = started
+        self.phases = []
+
+    def mark(self, phase, at=None):
+        """Closes the phase that ran since the previous mark"""
+        at = time.perf_counter() if at is None else at
+        self.phases.append((phase, at - self.last_mark))
+        self.last_mark = at
+
+    def report(self):
+        total = self.last_mark - self.started
+        lines = ['Start up profile:']
+        for phase, seconds in self.phases:
+            share = seconds / total * 100 if total else 0
+            lines.append(f'  {phase:<24} {seconds * 1000:8.1f} ms  {share:5.1f}%')
+        lines.append(f'  {"time to first window":<24} {total * 1000:8.1f} ms')
+        return '\n'.join(lines)
@@ -0,0 +1,129 @@
+WINDOW_SIZE = 200  # Longer lists only render this many rows at a time
+
+
+def diff_rows(rendered, wanted):
+    """What turns the rendered rows into the wanted ones, both dicts of iid -> values in display order.
+
+    Returns the iids to delete and a list of ('insert', index, iid, values), ('move', index, iid)
+    and ('update', iid, values) operations to apply in order after the deletes. Rows that kept
+    their place and values cost nothing, so adding, editing or deleting one line is one operation.
+    """
+    deletes = [iid for iid in rendered if iid not in wanted]
+    kept = [iid for iid in rendered if iid in wanted]
+    operations = []
+    moved = set()
+    position = 0
+    for index, (iid, values) in enumerate(wanted.items()):
+        while position < len(kept) and kept[position] in moved:
+            position += 1
+        if iid not in rendered:
+            operations.append(('insert', index, iid, values))
+            continue
+        if position < len(kept) and kept[position] == iid:
+            position += 1
+        else:
+            operations.append(('move', index, iid))
+            moved.add(iid)
+        if rendered[iid] != values:
+            operations.append(('update', iid, values))
+    return deletes, operations
+
+
+class TreeviewModel:
+    """The rows a ttk.Treeview should show, applied to the widget as a diff in one idle callback.
+
+    Callers change rows by iid and the widget catches up once the event loop is idle,
+    with only the deletes, inserts, moves and value updates that differ from what it
+    shows. Lists longer than window_size render a window of rows; scrolling past
+    either edge of the window with the mouse wheel or the arrow keys slides it.
+    """
+
+    def __init__(self, widget, window_size=WINDOW_SIZE):
+        self.widget = widget
+        self.window_size = window_size
+        self.rows = {}  # iid -> values, in display order
+        self.rendered = {}  # What the widget shows now
+        self.first = 0  # Position in rows of the first rendered row
+        self.follow_end = True  # Keep the newest rows in the window while it is scrolled to the end
+        self.flush_pending = False
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>', '<Up>', '<Down>'):
+            widget.bind(sequence, self.on_scroll, add='+')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, iid):
+        return iid in self.rows
+
+    def set_rows(self, rows):
+        """Replaces every row with the (iid, values) pairs given"""
+        self.rows = {iid: tuple(values) for iid, values in rows}
+        self.schedule()
+
+    def upsert(self, iid, values):
+        """Adds a row at the end, or changes the values of an existing one in place"""
+        self.rows[iid] = tuple(values)
+        self.schedule()
+
+    def remove(self, iid):
+        if self.rows.pop(iid, None) is not None:
+            self.schedule()
+
+    def clear(self):
+        self.rows = {}
+        self.first = 0
+        self.follow_end = True
+        self.schedule()
+
+    def schedule(self):
+        if not self.flush_pending:
+            self.flush_pending = True
+            self.widget.after_idle(self.flush)
+
+    def visible_rows(self):
+        if len(self.rows) <= self.window_size:
+            self.first = 0
+            return self.rows
+        last_first = len(self.rows) - self.window_size
+        self.first = last_first if self.follow_end else min(self.first, last_first)
+        items = list(self.rows.items())
+        return dict(items[self.first:self.first + self.window_size])
+
+    def flush(self):
+        self.flush_pending = False
+        if not self.widget.winfo_exists():
+            return
+        wanted = self.visible_rows()
+        deletes, operations = diff_rows(self.rendered, wanted)
+        if deletes:
+            self.widget.delete(*deletes)
+        for operation in operations:
+            if operation[0] == 'insert':
+                self.widget.insert('', operation[1], iid=operation[2], values=operation[3])
+            elif operation[0] == 'move':
+                self.widget.move(operation[2], '', operation[1])
+            else:
+                self.widget.item(operation[1], values=operation[2])
+        self.rendered = dict(wanted)  # A copy, wanted may be self.rows itself
+
+    def slide(self, step):
+        """Moves the window by step rows, keeping the row at its edge in view"""
+        first = max(0, min(self.first + step, len(self.rows) - self.window_size))
+        if first == self.first:
+            return
+        rendered = list(self.rendered)
+        anchor = rendered[-1] if step > 0 else rendered[0]
+        self.first = first
+        self.follow_end = first == len(self.rows) - self.window_size
+        self.flush()
+        self.widget.see(anchor)
+
+    def on_scroll(self, event):
+        if len(self.rows) <= self.window_size or not self.rendered:
+            return
+        down = event.keysym == 'Down' or event.num == 5 or getattr(event, 'delta', 0) < 0
+        top, bottom = self.widget.yview()
+        if down and bottom >= 1.0:
+            self.slide(self.window_size // 4)
+        elif not down and top <= 0.0:
+            self.slide(-(self.window_size // 4))